@@ -1,16 +1,139 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, redirect
 from flask_cors import CORS
 import sys
 import os
 import time
+from collections import deque
 
 # Import your pipeline functions
-from pipeline_2 import manim_pipeline, save_code_to_file, explain_manim_code
-from manim_renderer import render_manim_scene, cleanup_old_renders
+from pipeline_2 import generate_manim_code, stream_manim_pipeline, save_code_to_file, response_cache, warm_up_rag, describe_edits
+from render_queue import render_queue, RenderQueueFull
+from render_cache import render_cache
+from render_index import render_index
+from render_janitor import render_janitor
+from video_packaging import package_hls, get_ffmpeg, HLS_PLAYLIST
+from render_worker import warm_pool
+from explanations import explanation_store, explanation_id
+from preflight import PreflightError, validate_code
+from chat_sessions import chat_sessions
+from model_router import code_router
+from ollama_client import ollama_client
+import threading
+import config
+import json
 
 app = Flask(__name__)
+# Let Apache/lighttpd (mod_xsendfile) send video bytes instead of a Python worker
+app.use_x_sendfile = config.VIDEO_OFFLOAD == 'x-sendfile'
 CORS(app)  # Enable CORS for Next.js frontend
 
+
+def get_video_url(video_path):
+    """Convert a rendered video path into the /video/ URL that serves it."""
+    # Convert to forward slashes and extract everything after 'videos/'
+    video_path_normalized = video_path.replace('\\', '/')
+    if 'videos/' in video_path_normalized:
+        relative_path = video_path_normalized.split('videos/', 1)[1]
+    else:
+        relative_path = os.path.basename(video_path)
+    
+    return f"/video/{relative_path}"
+
+
+# Content types of the files /video serves
+VIDEO_MIMETYPES = {
+    '.mp4': 'video/mp4',
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(generator):
+    """Stream a generator of SSE messages without proxy buffering."""
+    response = Response(stream_with_context(generator), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def queue_full_response(e):
+    """503 response telling the client to retry once the render queue drains."""
+    response = jsonify({
+        'success': False,
+        'error': str(e),
+        'queue': render_queue.stats()
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '10'
+    return response
+
+
+def preflight_error_response(e):
+    """422 response listing why the code was rejected before rendering."""
+    return jsonify({
+        'success': False,
+        'error': f"Code failed validation: {e}",
+        'errors': e.report['errors']
+    }), 422
+
+
+def start_speculative_work(message, code, chat_id, follow_up=False):
+    """
+    Start the work the user is likely to ask for next, as soon as code exists.
+
+    The explanation (SPECULATIVE_EXPLANATION) and a low-quality render
+    (SPECULATIVE_RENDER) run in the background; /visualize later attaches to
+    them instead of starting from scratch. Any speculative render still queued
+    for an earlier message in this chat is cancelled.
+
+    Follow-ups get no speculative explanation (they are edits, not new
+    problems), and neither does anything while the explanation model is also
+    a code tier, since it would compete with code generation for that model.
+    """
+    speculative = {'explanation_id': None, 'render_job_id': None}
+    if (config.SPECULATIVE_EXPLANATION and not follow_up
+            and config.EXPLANATION_MODEL not in code_router.tiers):
+        speculative['explanation_id'] = explanation_store.start(message)
+        speculative['explanation_stream_url'] = f"/explanations/{speculative['explanation_id']}/stream"
+    
+    if config.SPECULATIVE_RENDER:
+        render_queue.cancel_speculative(chat_id)
+        try:
+            job = render_queue.submit(code, quality='l', chat_id=chat_id,
+                                      user_request=message, speculative=True)
+            speculative['render_job_id'] = job.job_id
+        except (RenderQueueFull, PreflightError) as e:
+            print(f"⚠️ Skipping speculative render: {e}")
+    
+    return speculative
+
+
+def job_status_payload(job):
+    """Status of a render job plus links for polling and fetching the result."""
+    payload = render_queue.describe(job)
+    payload['success'] = True
+    payload['status_url'] = f"/render-jobs/{job.job_id}"
+    payload['result_url'] = f"/render-jobs/{job.job_id}/result"
+    payload['events_url'] = f"/render-jobs/{job.job_id}/events"
+    if job.log:
+        payload['log_url'] = f"/render-jobs/{job.job_id}/log"
+    if job.user_request and explanation_store.get(explanation_id(job.user_request)):
+        payload['explanation_url'] = f"/explanations/{explanation_id(job.user_request)}"
+        payload['explanation_stream_url'] = f"/explanations/{explanation_id(job.user_request)}/stream"
+    if job.status == 'failed' and job.result:
+        payload['error'] = job.result.get('error')
+    if job.status == 'completed':
+        # The client is about to fetch it; keep the janitor away for a while
+        render_janitor.pin(job.result.get('video_path'))
+    payload['ladder_url'] = f"/render-ladder/{job.content_key}"
+    return payload
+
+
 @app.route('/process', methods=['POST'])
 def process_message():
     """
@@ -20,6 +143,7 @@ def process_message():
         data = request.json
         message = data.get('message', '')
         chat_id = data.get('chat_id', '')
+        follow_up = data.get('follow_up', False)
         
         print(f"\n{'='*80}")
         print(f"Received request for chat_id: {chat_id}")
@@ -28,10 +152,14 @@ def process_message():
         
         # Run your Manim pipeline
         start_time = time.time()
-        generated_code = manim_pipeline(message)
+        pipeline_result = generate_manim_code(message, chat_id=chat_id, follow_up=follow_up)
+        generated_code = pipeline_result['code']
         execution_time = time.time() - start_time
         
         if generated_code:
+            speculative = start_speculative_work(message, generated_code, chat_id,
+                                                 follow_up=pipeline_result.get('follow_up', False))
+            
             # Don't save the file to avoid triggering Flask reload
             # The code is already returned to frontend and will be passed to renderer
             # filename = f"generated_manim_{chat_id}_{int(time.time())}.py"
@@ -42,7 +170,13 @@ def process_message():
                 'response': f"Successfully generated Manim code based on your request!",
                 'code': generated_code,
                 'execution_time': round(execution_time, 2),
-                'chat_id': chat_id
+                'chat_id': chat_id,
+                'cached': pipeline_result['cached'],
+                'cache_similarity': pipeline_result.get('similarity'),
+                'follow_up': pipeline_result.get('follow_up', False),
+                'model': pipeline_result.get('model'),
+                'validation': validate_code(generated_code),
+                **speculative
             })
         else:
             return jsonify({
@@ -63,16 +197,70 @@ def process_message():
         }), 500
 
 
+@app.route('/process/stream', methods=['POST'])
+def process_message_stream():
+    """
+    Streaming version of /process over Server-Sent Events.
+
+    Emits `retrieval` when the template is found, `token` events as the model
+    generates, and a closing `done` event with the extracted code plus
+    time-to-first-token and tokens/sec (or `error`). In patch mode a
+    `fallback` event precedes a full regeneration when the edits don't apply.
+    """
+    data = request.json or {}
+    message = data.get('message', '')
+    chat_id = data.get('chat_id', '')
+    follow_up = data.get('follow_up', False)
+    
+    if not message:
+        return jsonify({
+            'success': False,
+            'error': 'No message provided'
+        }), 400
+    
+    print(f"\n{'='*80}")
+    print(f"Received streaming request for chat_id: {chat_id}")
+    print(f"User message: {message}")
+    print(f"{'='*80}\n")
+    
+    def generate():
+        try:
+            for event, payload in stream_manim_pipeline(message, chat_id=chat_id, follow_up=follow_up):
+                if event == 'done':
+                    if payload.get('code'):
+                        payload['validation'] = validate_code(payload['code'])
+                        payload.update(start_speculative_work(message, payload['code'], chat_id,
+                                                              follow_up=payload.get('follow_up', False)))
+                    payload = {'success': True, 'chat_id': chat_id, **payload}
+                yield sse_event(event, payload)
+        except Exception as e:
+            print(f"Error in process_message_stream: {e}")
+            import traceback
+            traceback.print_exc()
+            yield sse_event('error', {'success': False, 'error': str(e)})
+    
+    return sse_response(generate())
+
+
 @app.route('/visualize', methods=['POST'])
 def create_visualization():
     """
-    Generate and render Manim visualization from code
+    Generate and render Manim visualization from code.
+
+    Pass "async": true to get a render job id back immediately (HTTP 202)
+    and poll /render-jobs/<job_id> instead of waiting for the render.
+
+    Pass "progressive": true to get a low-quality preview first while the
+    requested quality renders in the background (see /render-ladder).
     """
     try:
         data = request.json
         code = data.get('code', '')
         quality = data.get('quality', 'l')  # l, m, h
         user_request = data.get('user_request', 'visualization request')  # Get original user request
+        chat_id = data.get('chat_id')
+        run_async = data.get('async', False)
+        progressive = data.get('progressive', False)
         
         if not code:
             return jsonify({
@@ -84,50 +272,78 @@ def create_visualization():
         print(f"Rendering Manim code...")
         print(f"{'='*80}\n")
         
-        # Render the Manim scene
-        render_result = render_manim_scene(code, quality=quality, preview=False)
+        try:
+            if progressive:
+                # Wait for the preview tier; better tiers follow in the background
+                job = render_queue.submit_ladder(code, quality=quality, chat_id=chat_id,
+                                                 user_request=user_request)[0]
+            else:
+                job = render_queue.submit(code, quality=quality, chat_id=chat_id,
+                                          user_request=user_request)
+        except RenderQueueFull as e:
+            return queue_full_response(e)
+        except PreflightError as e:
+            return preflight_error_response(e)
+        
+        # Speculative renders of code the user didn't end up rendering are stale now
+        render_queue.cancel_speculative(chat_id, keep=job)
+        
+        # Follow-up messages edit what the user actually rendered (they may have changed it)
+        session = chat_sessions.get(chat_id)
+        if session and session.code != code:
+            chat_sessions.update(chat_id, code=code)
+        
+        # Explain in parallel with the render (reuses a run started by /process)
+        explanation_key = explanation_store.start(user_request, code)
+        
+        if run_async:
+            return jsonify(job_status_payload(job)), 202
+        
+        # Blocking mode: the render still runs on the bounded worker pool
+        if not job.wait(timeout=config.RENDER_WAIT_TIMEOUT):
+            payload = job_status_payload(job)
+            payload['message'] = 'Render is still in progress, poll status_url for the result'
+            return jsonify(payload), 202
+        
+        render_result = job.result
         
         if render_result['success']:
-            # Get the relative path from renders/videos/ directory
             video_path = render_result['video_path']
+            render_janitor.pin(video_path)
             
-            # Verify the file exists before cleanup
+            # Verify the file exists
             if not os.path.exists(video_path):
                 print(f"⚠️ WARNING: Video file not found immediately after rendering: {video_path}")
             else:
                 print(f"✅ Verified video exists at: {video_path}")
             
-            # Convert to forward slashes and extract everything after 'videos/'
-            video_path_normalized = video_path.replace('\\', '/')
-            if 'videos/' in video_path_normalized:
-                relative_path = video_path_normalized.split('videos/', 1)[1]
-            else:
-                relative_path = os.path.basename(video_path)
-            
-            video_url = f"/video/{relative_path}"
-            
-            # Clean up old renders AFTER we've confirmed the current video exists
-            # Keep more videos to avoid accidental deletion
-            cleanup_old_renders('renders', keep_last_n=20)
-            
-            # Generate explanation using Gemma 3:4b
-            print(f"\n{'='*80}")
-            print(f"Generating code explanation with Gemma 3:4b...")
-            print(f"{'='*80}\n")
+            video_url = get_video_url(video_path)
             
-            explanation = explain_manim_code(code, user_request)
+            # Join the explanation started alongside the render. If it is
+            # still running the client can fetch it later from explanation_url.
+            explanation = explanation_store.result(explanation_key, timeout=config.EXPLANATION_JOIN_TIMEOUT)
             
             return jsonify({
                 'success': True,
+                'job_id': job.job_id,
+                'explanation_id': explanation_key,
+                'explanation_url': f"/explanations/{explanation_key}",
+                'explanation_stream_url': f"/explanations/{explanation_key}/stream",
                 'video_path': render_result['video_path'],
                 'video_url': video_url,
+                'hls_url': f"{video_url}?format=hls" if config.VIDEO_HLS_ENABLED else None,
                 'scene_name': render_result['scene_name'],
+                'cached': render_result.get('cached', False),
+                'warning': render_result.get('warning'),
+                'quality': job.quality,
+                'ladder_url': f"/render-ladder/{job.content_key}",
                 'explanation': explanation,
                 'message': 'Video rendered successfully!'
             })
         else:
             return jsonify({
                 'success': False,
+                'job_id': job.job_id,
                 'error': render_result['error']
             }), 500
     
@@ -142,6 +358,45 @@ def create_visualization():
         }), 500
 
 
+@app.route('/explanations/<explanation_key>', methods=['GET'])
+def get_explanation(explanation_key):
+    """
+    Explanation generated in the background. Returns 202 while it is still running.
+    """
+    info = explanation_store.describe(explanation_key)
+    if not info:
+        return jsonify({
+            'success': False,
+            'error': 'Explanation not found'
+        }), 404
+    
+    info['success'] = True
+    return jsonify(info), 202 if info['status'] == 'running' else 200
+
+
+@app.route('/explanations/<explanation_key>/stream', methods=['GET'])
+def stream_explanation_text(explanation_key):
+    """
+    Server-Sent Events stream of an explanation as it is written
+    """
+    if not explanation_store.get(explanation_key):
+        return jsonify({
+            'success': False,
+            'error': 'Explanation not found'
+        }), 404
+    
+    def generate():
+        for text in explanation_store.follow(explanation_key):
+            if text is None:
+                # Keep the connection alive through proxies
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event('token', {'text': text})
+        yield sse_event('done', explanation_store.describe(explanation_key))
+    
+    return sse_response(generate())
+
+
 @app.route('/render-and-download', methods=['POST'])
 def render_and_download():
     """
@@ -158,8 +413,18 @@ def render_and_download():
                 'error': 'No code provided'
             }), 400
         
-        # Render the scene
-        render_result = render_manim_scene(code, quality=quality, preview=False)
+        # Render the scene on the worker pool
+        try:
+            job = render_queue.submit(code, quality=quality, chat_id=data.get('chat_id'))
+        except RenderQueueFull as e:
+            return queue_full_response(e)
+        except PreflightError as e:
+            return preflight_error_response(e)
+        
+        if not job.wait(timeout=config.RENDER_WAIT_TIMEOUT):
+            return jsonify(job_status_payload(job)), 202
+        
+        render_result = job.result
         
         if render_result['success']:
             video_path = render_result['video_path']
@@ -184,6 +449,265 @@ def render_and_download():
         }), 500
 
 
+@app.route('/render-jobs', methods=['POST'])
+def submit_render_job():
+    """
+    Queue a render and return its job id immediately (HTTP 202)
+    """
+    try:
+        data = request.json
+        code = data.get('code', '')
+        
+        if not code:
+            return jsonify({
+                'success': False,
+                'error': 'No code provided'
+            }), 400
+        
+        try:
+            job = render_queue.submit(
+                code,
+                quality=data.get('quality', 'l'),
+                chat_id=data.get('chat_id'),
+                user_request=data.get('user_request')
+            )
+        except RenderQueueFull as e:
+            return queue_full_response(e)
+        except PreflightError as e:
+            return preflight_error_response(e)
+        
+        return jsonify(job_status_payload(job)), 202
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/render-jobs', methods=['GET'])
+def list_render_jobs():
+    """
+    List tracked render jobs (optionally filtered by ?chat_id= or ?status=)
+    """
+    chat_id = request.args.get('chat_id')
+    status = request.args.get('status')
+    
+    jobs = []
+    for job in render_queue.list_jobs():
+        if chat_id and job.chat_id != chat_id:
+            continue
+        if status and job.status != status:
+            continue
+        jobs.append(render_queue.describe(job))
+    
+    return jsonify({
+        'success': True,
+        'jobs': jobs,
+        'queue': render_queue.stats()
+    })
+
+
+@app.route('/render-jobs/<job_id>', methods=['GET'])
+def get_render_job(job_id):
+    """
+    Status of a render job: position in queue, ETA and elapsed time
+    """
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify(job_status_payload(job))
+
+
+@app.route('/render-jobs/<job_id>/result', methods=['GET'])
+def get_render_job_result(job_id):
+    """
+    Result of a finished render job. Returns 202 while the job is still pending.
+    Pass ?download=1 to receive the MP4 itself.
+    """
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    if not job.finished:
+        return jsonify(job_status_payload(job)), 202
+    
+    render_result = job.result
+    if not render_result['success']:
+        return jsonify({
+            'success': False,
+            'job_id': job.job_id,
+            'status': job.status,
+            'error': render_result['error']
+        }), 500
+    
+    video_path = render_result['video_path']
+    render_janitor.pin(video_path)
+    if not os.path.exists(video_path):
+        return jsonify({
+            'success': False,
+            'job_id': job.job_id,
+            'error': 'Rendered video has been cleaned up, please render again'
+        }), 410
+    
+    if request.args.get('download'):
+        return send_file(
+            video_path,
+            mimetype='video/mp4',
+            as_attachment=True,
+            download_name=f"{render_result['scene_name']}.mp4"
+        )
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.job_id,
+        'status': job.status,
+        'video_path': video_path,
+        'video_url': get_video_url(video_path),
+        'scene_name': render_result['scene_name'],
+        'cached': render_result.get('cached', False),
+        'warning': render_result.get('warning'),
+        'elapsed': round(job.elapsed(), 2),
+        'message': 'Video rendered successfully!'
+    })
+
+
+@app.route('/render-jobs/<job_id>/events', methods=['GET'])
+def stream_render_job(job_id):
+    """
+    Server-Sent Events stream of job status updates until the job finishes
+    """
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    def generate():
+        last_state = None
+        while True:
+            payload = job_status_payload(job)
+            state = (payload['status'], payload['position'], str(payload['progress']))
+            if state != last_state:
+                yield sse_event('status', payload)
+                last_state = state
+            else:
+                # Keep the connection alive through proxies
+                yield ": keep-alive\n\n"
+            if job.finished:
+                break
+            job.wait(timeout=1)
+    
+    return sse_response(generate())
+
+
+@app.route('/render-jobs/<job_id>/log', methods=['GET'])
+def get_render_job_log(job_id):
+    """
+    manim's output for a render job as plain text, read from its log file.
+    Pass ?tail=N for only the last N lines.
+    """
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    if not job.log:
+        message = 'Served from the render cache, nothing was rendered' if job.finished else 'Job has not started yet'
+        return jsonify({
+            'success': False,
+            'error': message
+        }), 404
+    
+    job.log.sync()
+    if not os.path.exists(job.log.path):
+        return Response('', mimetype='text/plain')
+    
+    tail = request.args.get('tail', type=int)
+    if tail:
+        with open(job.log.path, 'r', encoding='utf-8', errors='replace') as log_file:
+            lines = deque(log_file, maxlen=tail)
+        return Response(''.join(lines), mimetype='text/plain')
+    
+    response = send_file(os.path.abspath(job.log.path), mimetype='text/plain', conditional=False)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def ladder_payload(content_key):
+    """Quality ladder of one piece of code with video URLs for the finished tiers."""
+    ladder = render_queue.ladder_status(content_key)
+    for tier in ladder['tiers'].values():
+        if tier.get('video_path'):
+            tier['video_url'] = get_video_url(tier.pop('video_path'))
+    ladder['success'] = True
+    ladder['events_url'] = f"/render-ladder/{content_key}/events"
+    return ladder
+
+
+@app.route('/render-ladder/<content_key>', methods=['GET'])
+def get_render_ladder(content_key):
+    """
+    Every quality tier rendered (or rendering) for one piece of code
+    """
+    ladder = ladder_payload(content_key)
+    if not ladder['tiers']:
+        return jsonify({
+            'success': False,
+            'error': 'No renders found for this code'
+        }), 404
+    return jsonify(ladder)
+
+
+@app.route('/render-ladder/<content_key>/events', methods=['GET'])
+def stream_render_ladder(content_key):
+    """
+    Server-Sent Events stream with a `tier` event each time a quality tier
+    becomes available, closed by `done` once no tier is pending
+    """
+    def generate():
+        announced = set()
+        while True:
+            ladder = ladder_payload(content_key)
+            ready = [q for q, tier in ladder['tiers'].items() if tier['status'] == 'completed']
+            new_tiers = [q for q in ready if q not in announced]
+            for quality in new_tiers:
+                yield sse_event('tier', {'quality': quality, **ladder['tiers'][quality]})
+                announced.add(quality)
+            if not ladder['pending']:
+                yield sse_event('done', ladder)
+                break
+            if not new_tiers:
+                yield ": keep-alive\n\n"
+            time.sleep(1)
+    
+    return sse_response(generate())
+
+
+@app.route('/render-cache', methods=['GET'])
+def render_cache_stats():
+    """
+    Render cache hit/miss statistics
+    """
+    return jsonify({
+        'success': True,
+        'cache': render_cache.stats(),
+        'index': render_index.stats(),
+        'disk': render_janitor.describe(),
+        'response_cache': response_cache.stats()
+    })
+
+
 @app.route('/execute', methods=['POST'])
 def execute_script():
     """
@@ -214,7 +738,16 @@ def execute_script():
 @app.route('/video/<path:filename>', methods=['GET'])
 def serve_video(filename):
     """
-    Serve rendered video files with proper CORS headers
+    Serve rendered video files with proper CORS headers.
+
+    Range and conditional requests (If-None-Match / If-Range) are answered
+    with 206/304 so seeking doesn't refetch the whole MP4. The ETag is the
+    video's content hash from the render index, and content-addressed render
+    cache files are marked immutable. With VIDEO_OFFLOAD set the bytes are
+    sent by the front web server (X-Sendfile / X-Accel-Redirect) instead.
+
+    Add ?format=hls to an MP4 URL to be redirected to its HLS playlist
+    (segmented on first request if it wasn't packaged after rendering).
     """
     try:
         # Get the base directory
@@ -239,19 +772,61 @@ def serve_video(filename):
         
         if os.path.exists(video_path) and os.path.isfile(video_path):
             print(f"✅ Found video at: {video_path}")
+            relative_path = os.path.relpath(video_path, video_dir).replace('\\', '/')
             
-            # Create response with proper headers
-            response = send_file(
-                video_path,
-                mimetype='video/mp4',
-                as_attachment=False,
-                download_name=os.path.basename(video_path)
-            )
+            if request.args.get('format') == 'hls' and video_path.endswith('.mp4'):
+                if not get_ffmpeg():
+                    return jsonify({
+                        'success': False,
+                        'error': 'HLS packaging is unavailable (ffmpeg not found)'
+                    }), 501
+                playlist = package_hls(video_path)
+                return redirect('/video/' + os.path.relpath(playlist, video_dir).replace('\\', '/'))
+            
+            mimetype = VIDEO_MIMETYPES.get(os.path.splitext(video_path)[1], 'application/octet-stream')
+            
+            # Last-served time drives the janitor's eviction order. Seeks
+            # (ranges past the start) are part of the same viewing; an HLS
+            # playlist fetch counts for the MP4 it was cut from.
+            served_path = video_path
+            if video_path.endswith(HLS_PLAYLIST):
+                hls_folder = os.path.dirname(video_path)
+                served_path = hls_folder[:-len('_hls')] + '.mp4'
+            if not request.range or request.range.ranges[0][0] == 0:
+                render_index.touch(served_path)
+            
+            indexed = render_index.get(video_path)
+            etag = indexed['hash'] if indexed and indexed['hash'] else True
+            # Cache files are named by the hash of what produced them, so they never change
+            immutable = video_path.startswith(os.path.join(video_dir, 'cache') + os.sep)
+            
+            if config.VIDEO_OFFLOAD == 'x-accel-redirect':
+                # nginx serves the file (and ranges) from an internal location
+                response = Response(mimetype=mimetype)
+                response.headers['X-Accel-Redirect'] = config.VIDEO_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative_path
+                if isinstance(etag, str):
+                    response.set_etag(etag)
+                    response.make_conditional(request)
+            else:
+                # conditional=True handles Range, If-Range and If-None-Match; with
+                # app.use_x_sendfile the body is left to the web server
+                response = send_file(
+                    video_path,
+                    mimetype=mimetype,
+                    as_attachment=False,
+                    download_name=os.path.basename(video_path),
+                    conditional=True,
+                    etag=etag
+                )
             
             # Add CORS and caching headers
             response.headers['Access-Control-Allow-Origin'] = '*'
             response.headers['Accept-Ranges'] = 'bytes'
-            response.headers['Cache-Control'] = 'no-cache'
+            if immutable:
+                response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            else:
+                # Revalidate with the ETag; a re-render with the same name changes it
+                response.headers['Cache-Control'] = 'no-cache'
             
             return response
         
@@ -268,6 +843,36 @@ def serve_video(filename):
         }), 500
 
 
+@app.route('/sessions/<chat_id>', methods=['GET'])
+def get_chat_session(chat_id):
+    """
+    What a chat's follow-up messages will edit: its template, turn count and model context size
+    """
+    session = chat_sessions.get(chat_id)
+    if not session:
+        return jsonify({
+            'success': False,
+            'error': 'No session for this chat'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        **session.to_dict(),
+        'code': session.code
+    })
+
+
+@app.route('/sessions/<chat_id>', methods=['DELETE'])
+def end_chat_session(chat_id):
+    """
+    Forget a chat's code so its next message starts from retrieval again
+    """
+    return jsonify({
+        'success': True,
+        'ended': chat_sessions.end(chat_id)
+    })
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
@@ -275,10 +880,33 @@ def health_check():
     """
     return jsonify({
         'status': 'healthy',
-        'message': 'Python backend is running'
+        'message': 'Python backend is running',
+        'render_queue': render_queue.stats(),
+        'code_edits': describe_edits(),
+        'model_routing': code_router.describe(),
+        'ollama': ollama_client.describe(),
+        'explanations': explanation_store.describe_cache(),
+        'chat_sessions': chat_sessions.describe(),
+        'warm_render_pool': warm_pool.describe() if config.RENDER_BACKEND == 'warm' else None
     })
 
 
+# Background startup work, in every serving process (WSGI workers included)
+# but not the debug reloader's watcher
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    # Enforce the render disk quota from startup
+    render_janitor.start()
+    # Open Pinecone connections so the first user request isn't the slow one
+    threading.Thread(target=warm_up_rag, daemon=True).start()
+    # Load the LLMs now so the first generation doesn't wait for them
+    if config.OLLAMA_PRELOAD:
+        threading.Thread(target=ollama_client.preload, args=(config.OLLAMA_PRELOAD_MODELS,),
+                         daemon=True).start()
+    # Pre-import manim
+    if config.RENDER_BACKEND == 'warm':
+        threading.Thread(target=warm_pool.warm_up, daemon=True).start()
+
+
 if __name__ == '__main__':
     # Exclude generated files and renders from triggering reloads
     import os
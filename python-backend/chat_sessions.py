@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+class ChatSession:
+    """What one chat has built so far: its current code, template and model context."""
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.code = None
+        self.template = None
+        self.template_file = None
+        # Ollama's context tokens from the last generation; passing them back
+        # continues the conversation and lets Ollama reuse the cached prefix
+        self.context = None
+        self.context_model = None  # contexts only mean something to the model that made them
+        self.turns = 0
+        self.created_at = self.updated_at = time.time()
+
+    def to_dict(self):
+        return {
+            'chat_id': self.chat_id,
+            'has_code': self.code is not None,
+            'template_file': self.template_file,
+            'context_tokens': len(self.context) if self.context else 0,
+            'context_model': self.context_model,
+            'turns': self.turns,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }
+
+
+class ChatSessionStore:
+    """
+    Per-chat state so follow-up messages edit the chat's current code instead
+    of retrieving a fresh template.
+
+    At most `max_sessions` chats are kept (least recently used dropped first),
+    sessions idle for `idle_seconds` expire, and a model context longer than
+    `max_context_tokens` is dropped so the next turn starts a new conversation.
+    """
+
+    def __init__(self, max_sessions=500, idle_seconds=3600, max_context_tokens=16384):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_context_tokens = max_context_tokens
+        self._sessions = OrderedDict()  # chat_id -> ChatSession, least recently used first
+        self._lock = threading.Lock()
+        self.stats = {'follow_ups': 0, 'expired': 0, 'evicted': 0}
+
+    def _expire(self, now):
+        while self._sessions:
+            chat_id, session = next(iter(self._sessions.items()))
+            if now - session.updated_at <= self.idle_seconds:
+                break
+            del self._sessions[chat_id]
+            self.stats['expired'] += 1
+
+    def get(self, chat_id):
+        """The chat's session if it has one that hasn't expired, else None."""
+        if not chat_id:
+            return None
+        with self._lock:
+            self._expire(time.time())
+            session = self._sessions.get(chat_id)
+            if session:
+                self._sessions.move_to_end(chat_id)
+            return session
+
+    def update(self, chat_id, code=None, template=None, template_file=None, context=None,
+               context_model=None):
+        """Record a turn of the chat. Arguments left as None keep their previous value."""
+        if not chat_id:
+            return None
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(chat_id)
+            if session is None:
+                session = self._sessions[chat_id] = ChatSession(chat_id)
+            self._sessions.move_to_end(chat_id)
+            if code is not None:
+                session.code = code
+            if template is not None:
+                session.template = template
+                session.template_file = template_file
+            if context is not None:
+                session.context = context if len(context) <= self.max_context_tokens else None
+                session.context_model = context_model
+            session.turns += 1
+            session.updated_at = now
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats['evicted'] += 1
+        return session
+
+    def end(self, chat_id):
+        """Forget a chat so its next message starts from retrieval again. Returns True if it existed."""
+        with self._lock:
+            return self._sessions.pop(chat_id, None) is not None
+
+    def describe(self):
+        with self._lock:
+            self._expire(time.time())
+            sessions = len(self._sessions)
+        return {
+            'sessions': sessions,
+            'max_sessions': self.max_sessions,
+            'idle_seconds': self.idle_seconds,
+            **self.stats,
+        }
+
+
+chat_sessions = ChatSessionStore(
+    max_sessions=config.CHAT_SESSION_MAX,
+    idle_seconds=config.CHAT_SESSION_IDLE_SECONDS,
+    max_context_tokens=config.CHAT_SESSION_MAX_CONTEXT_TOKENS,
+)
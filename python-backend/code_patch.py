@@ -0,0 +1,127 @@
+import re
+
+from preflight import validate_code
+
+
+SEARCH_MARKER = re.compile(r'<{5,}\s*SEARCH')
+DIVIDER_MARKER = re.compile(r'={5,}')
+REPLACE_MARKER = re.compile(r'>{5,}\s*REPLACE')
+
+# Validation errors that mean the edit broke the code (imports and calls are
+# checked again by preflight before rendering, as for full generations)
+STRUCTURAL_ERRORS = ('syntax_error', 'no_scene', 'missing_construct')
+
+
+class PatchError(Exception):
+    """Raised when an edit response can't be applied to the code it was written against."""
+    pass
+
+
+def parse_edit_blocks(text):
+    """
+    Search/replace blocks from an LLM response, as a list of (search, replace):
+
+        <<<<<<< SEARCH
+        lines copied from the code
+        =======
+        lines that replace them
+        >>>>>>> REPLACE
+
+    Anything outside the blocks (code fences, stray prose) is ignored.
+    """
+    blocks = []
+    state = None
+    search, replace = [], []
+    for line in text.splitlines():
+        marker = line.strip()
+        if state is None:
+            if SEARCH_MARKER.fullmatch(marker):
+                state = 'search'
+                search, replace = [], []
+        elif state == 'search' and DIVIDER_MARKER.fullmatch(marker):
+            state = 'replace'
+        elif state == 'replace' and REPLACE_MARKER.fullmatch(marker):
+            blocks.append(('\n'.join(search), '\n'.join(replace)))
+            state = None
+        elif state == 'search':
+            search.append(line)
+        else:
+            replace.append(line)
+    if state is not None:
+        raise PatchError('Unterminated edit block')
+    return blocks
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip(' '))
+
+
+def _find(lines, search_lines, normalize):
+    """Start indexes at which search_lines occur in lines, comparing normalize(line)."""
+    wanted = [normalize(line) for line in search_lines]
+    size = len(wanted)
+    return [start for start in range(len(lines) - size + 1)
+            if [normalize(line) for line in lines[start:start + size]] == wanted]
+
+
+def _reindent(lines, delta):
+    """Shift non-blank lines right by delta spaces (left if negative)."""
+    if delta > 0:
+        return [' ' * delta + line if line.strip() else line for line in lines]
+    if delta < 0:
+        return [line[min(-delta, _indent(line)):] for line in lines]
+    return lines
+
+
+def apply_edit_blocks(source, blocks):
+    """
+    Apply (search, replace) blocks in order and return the new source.
+
+    A search must match exactly one place. Matching ignores trailing
+    whitespace, and if that fails, indentation too, in which case the
+    replacement is shifted by the same amount the match was. Raises
+    PatchError when a block matches nowhere or more than once.
+    """
+    lines = source.split('\n')
+    for number, (search, replace) in enumerate(blocks, 1):
+        search_lines = search.split('\n')
+        # Blank lines around a search only make it harder to match
+        while search_lines and not search_lines[0].strip():
+            search_lines.pop(0)
+        while search_lines and not search_lines[-1].strip():
+            search_lines.pop()
+        if not search_lines:
+            raise PatchError(f"Edit {number} has an empty SEARCH section")
+        replace_lines = replace.split('\n') if replace else []
+
+        matches = _find(lines, search_lines, str.rstrip)
+        if not matches:
+            matches = _find(lines, search_lines, str.strip)
+            if len(matches) == 1:
+                replace_lines = _reindent(replace_lines, _indent(lines[matches[0]]) - _indent(search_lines[0]))
+        if not matches:
+            raise PatchError(f"Edit {number} does not match the code: {search_lines[0].strip()!r}")
+        if len(matches) > 1:
+            raise PatchError(f"Edit {number} matches {len(matches)} places: {search_lines[0].strip()!r}")
+
+        start = matches[0]
+        lines[start:start + len(search_lines)] = replace_lines
+    return '\n'.join(lines)
+
+
+def apply_patch_response(source, response):
+    """
+    Apply an LLM's edit blocks to `source` and check the result still parses
+    and defines a renderable scene. Returns the new code or raises PatchError.
+    """
+    blocks = parse_edit_blocks(response)
+    if not blocks:
+        raise PatchError('No edit blocks in the response')
+    patched = apply_edit_blocks(source, blocks)
+
+    report = validate_code(patched, allowed_imports=(), blocked_calls=())
+    broken = [error for error in report['errors'] if error['type'] in STRUCTURAL_ERRORS]
+    if broken:
+        error = broken[0]
+        raise PatchError(f"Patched code is invalid: {error['message']} (line {error['line']})")
+    return patched
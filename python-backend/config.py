@@ -15,11 +15,38 @@ EMBEDDING_MODEL = "llama-text-embed-v2"
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
 PINECONE_ENVIRONMENT = os.getenv('PINECONE_ENVIRONMENT')
 PINECONE_INDEX_NAME = os.getenv('PINECONE_INDEX_NAME', 'manim-docs')
+PINECONE_TIMEOUT = float(os.getenv('PINECONE_TIMEOUT', '10'))  # Seconds per query, embed and fetch request
+PINECONE_MAX_RETRIES = int(os.getenv('PINECONE_MAX_RETRIES', '2'))  # Retries after the first attempt
+PINECONE_RETRY_BACKOFF = float(os.getenv('PINECONE_RETRY_BACKOFF', '0.5'))  # First retry delay, doubles each time
+PINECONE_POOL_SIZE = int(os.getenv('PINECONE_POOL_SIZE', '8'))  # Kept-alive HTTP connections
+
+# RAG Backend Configuration
+RAG_BACKEND = os.getenv('RAG_BACKEND', 'pinecone')  # 'pinecone' or 'local' (in-process index in LOCAL_INDEX_DIR)
+LOCAL_INDEX_DIR = os.getenv('LOCAL_INDEX_DIR', str(current_dir / 'local_index_data'))
+LOCAL_INDEX_DTYPE = os.getenv('LOCAL_INDEX_DTYPE', 'float16')  # 'float16' or 'int8' storage for embeddings
 
 # Ollama Configuration
 OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
 OLLAMA_EMBEDDING_MODEL = os.getenv('OLLAMA_EMBEDDING_MODEL', 'nomic-embed-text')  # For embeddings
 OLLAMA_LLM_MODEL = os.getenv('OLLAMA_LLM_MODEL', 'deepseek-r1:8b')  # For code generation
+CODE_EDIT_MODE = os.getenv('CODE_EDIT_MODE', 'full')  # 'full' (model rewrites the template) or 'patch' (model writes search/replace edits, full rewrite if they don't apply)
+
+# Model Routing Configuration
+CODE_MODEL_TIERS = [m for m in os.getenv('CODE_MODEL_TIERS', 'gpt-oss:20b').split(',') if m]  # Code models, smallest first (e.g. 'qwen2.5-coder:7b,gpt-oss:20b')
+MODEL_ROUTING_ENABLED = os.getenv('MODEL_ROUTING_ENABLED', 'true').lower() == 'true'  # Try smaller tiers first, escalate on invalid code
+ROUTER_MIN_SCORE = float(os.getenv('ROUTER_MIN_SCORE', '0.75'))  # Weaker template matches go straight to the largest tier
+ROUTER_MAX_PROMPT_CHARS = int(os.getenv('ROUTER_MAX_PROMPT_CHARS', '400'))  # ...as do longer requests
+ROUTER_MAX_TEMPLATE_CHARS = int(os.getenv('ROUTER_MAX_TEMPLATE_CHARS', '6000'))  # ...and longer templates
+ROUTER_MIN_SUCCESS_RATE = float(os.getenv('ROUTER_MIN_SUCCESS_RATE', '0.6'))  # Tiers validating less often than this are skipped
+ROUTER_HISTORY = int(os.getenv('ROUTER_HISTORY', '50'))  # Recent outcomes per tier behind the success rate
+ROUTER_PROBE_EVERY = int(os.getenv('ROUTER_PROBE_EVERY', '10'))  # A skipped tier still gets every Nth request
+EXPLANATION_MODEL = os.getenv('EXPLANATION_MODEL', 'deepseek-r1:1.5b')  # Model that writes explanations
+
+# Ollama Client Configuration
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # How long Ollama keeps a model loaded after its last call (-1 = forever)
+OLLAMA_MAX_CONCURRENT_PER_MODEL = int(os.getenv('OLLAMA_MAX_CONCURRENT_PER_MODEL', '2'))  # Calls sent to one model at once; the rest wait
+OLLAMA_PRELOAD = os.getenv('OLLAMA_PRELOAD', 'true').lower() == 'true'  # Load the models below when the server starts
+OLLAMA_PRELOAD_MODELS = [m for m in os.getenv('OLLAMA_PRELOAD_MODELS', ','.join(CODE_MODEL_TIERS + [EXPLANATION_MODEL])).split(',') if m]  # Defaults to the code tiers and the explanation model
 
 # Document Configuration
 DOCS_FOLDER = 'dataset'
@@ -29,3 +56,94 @@ CHUNK_OVERLAP = 400  # Overlap between chunks (20% of chunk size)
 # Vector Dimension (depends on your embedding model)
 # nomic-embed-text uses 768 dimensions
 VECTOR_DIMENSION = 768
+
+# Render Queue Configuration
+RENDER_CAPACITY = int(os.getenv('RENDER_CAPACITY', '0'))  # Render budget in low-quality units, 0 = size from CPU cores and memory
+RENDER_MEMORY_PER_UNIT_MB = int(os.getenv('RENDER_MEMORY_PER_UNIT_MB', '700'))  # Approximate memory of one -ql render
+RENDER_QUALITY_WEIGHTS = {'l': 1, 'm': 2, 'h': 4, 'p': 6, 'k': 8}  # Capacity units per quality flag
+RENDER_QUEUE_MAX_SIZE = int(os.getenv('RENDER_QUEUE_MAX_SIZE', '20'))  # Jobs allowed to wait
+RENDER_MAX_JOBS_PER_SESSION = int(os.getenv('RENDER_MAX_JOBS_PER_SESSION', '3'))  # Waiting jobs per chat
+RENDER_STARVATION_SECONDS = int(os.getenv('RENDER_STARVATION_SECONDS', '30'))  # Heavy jobs stop being skipped after this
+RENDER_JOB_HISTORY = int(os.getenv('RENDER_JOB_HISTORY', '200'))  # Finished jobs kept for status lookups
+RENDER_WAIT_TIMEOUT = int(os.getenv('RENDER_WAIT_TIMEOUT', '330'))  # Seconds blocking endpoints wait for a job
+SPECULATIVE_RENDER = os.getenv('SPECULATIVE_RENDER', 'false').lower() == 'true'  # Queue a background -ql render as soon as /process has code
+RENDER_LADDER = [q for q in os.getenv('RENDER_LADDER', 'l,m,h').split(',') if q]  # Tiers a progressive render climbs through
+
+# Render Cache Configuration
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv('RENDER_CACHE_MAX_ENTRIES', '100'))  # Cached MP4s kept (LRU)
+RENDER_INDEX_PATH = os.getenv('RENDER_INDEX_PATH', os.path.join('renders', 'render_index.sqlite3'))  # SQLite manifest of rendered videos
+
+# Render Disk Quota Configuration
+RENDER_DISK_QUOTA_MB = int(os.getenv('RENDER_DISK_QUOTA_MB', '2048'))  # Total size of rendered videos to keep
+RENDER_JANITOR_INTERVAL = int(os.getenv('RENDER_JANITOR_INTERVAL', '60'))  # Seconds between background sweeps
+RENDER_EVICTION_POLICY = os.getenv('RENDER_EVICTION_POLICY', 'lru')  # 'lru' (last served) or 'lfu' (times served)
+RENDER_PIN_SECONDS = int(os.getenv('RENDER_PIN_SECONDS', '600'))  # New or just-returned videos are kept at least this long
+
+# Video Serving Configuration
+VIDEO_OFFLOAD = os.getenv('VIDEO_OFFLOAD', '')  # '', 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect' (nginx)
+VIDEO_ACCEL_REDIRECT_PREFIX = os.getenv('VIDEO_ACCEL_REDIRECT_PREFIX', '/protected-videos/')  # nginx internal location mapped to renders/videos
+
+# Video Packaging Configuration
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')  # Used to remux/segment finished renders (skipped if missing)
+VIDEO_FASTSTART = os.getenv('VIDEO_FASTSTART', 'true').lower() == 'true'  # Move the moov atom to the front after rendering
+VIDEO_HLS_ENABLED = os.getenv('VIDEO_HLS_ENABLED', 'false').lower() == 'true'  # Also segment cached renders into HLS up front
+HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', '2'))  # Target HLS segment length
+PACKAGING_TIMEOUT = int(os.getenv('PACKAGING_TIMEOUT', '120'))  # Seconds allowed per ffmpeg call
+
+# Pre-flight Validation Configuration
+PREFLIGHT_ENABLED = os.getenv('PREFLIGHT_ENABLED', 'true').lower() == 'true'  # Check code with ast before queueing a render
+PREFLIGHT_ALLOWED_IMPORTS = os.getenv(
+    'PREFLIGHT_ALLOWED_IMPORTS',
+    'manim,numpy,math,random,itertools,functools,collections,typing,dataclasses,enum,string,colour,scipy,__future__'
+).split(',')  # Top-level modules generated code may import
+PREFLIGHT_BLOCKED_CALLS = os.getenv(
+    'PREFLIGHT_BLOCKED_CALLS', 'exec,eval,compile,__import__,open,input,breakpoint'
+).split(',')  # Builtins generated code may not call
+
+# Parallel Rendering Configuration
+PARALLEL_RENDER_ENABLED = os.getenv('PARALLEL_RENDER_ENABLED', 'true').lower() == 'true'  # Render every scene in a file at once and join them (needs ffmpeg)
+PARALLEL_SPLIT_SECTIONS = os.getenv('PARALLEL_SPLIT_SECTIONS', 'false').lower() == 'true'  # Also split scenes at self.next_section() calls
+PARALLEL_RENDER_WORKERS = int(os.getenv('PARALLEL_RENDER_WORKERS', str(max(1, (os.cpu_count() or 2) - 1))))  # Pieces of one job rendered at once
+
+# Render Backend Configuration
+RENDER_BACKEND = os.getenv('RENDER_BACKEND', 'subprocess')  # 'subprocess' (python -m manim per render) or 'warm' (pre-imported workers)
+RENDER_TIMEOUT = int(os.getenv('RENDER_TIMEOUT', '300'))  # Seconds before a render is abandoned
+WARM_RENDER_WORKERS = int(os.getenv('WARM_RENDER_WORKERS', '2'))  # Long-lived manim processes
+WARM_RENDER_MAX_JOBS = int(os.getenv('WARM_RENDER_MAX_JOBS', '50'))  # Recycle a worker after this many renders
+WARM_RENDER_MAX_MEMORY_MB = int(os.getenv('WARM_RENDER_MAX_MEMORY_MB', '1500'))  # ...or once it grows past this
+
+# Render Log Configuration
+RENDER_LOG_DIR = os.getenv('RENDER_LOG_DIR', os.path.join('renders', 'logs'))  # One manim output file per render job
+RENDER_LOG_TAIL_LINES = int(os.getenv('RENDER_LOG_TAIL_LINES', '40'))  # Last lines kept in memory for error messages
+RENDER_LOG_HISTORY = int(os.getenv('RENDER_LOG_HISTORY', '200'))  # Logs kept before the oldest are deleted
+
+# Partial Movie Cache Configuration
+PARTIAL_CACHE_ENABLED = os.getenv('PARTIAL_CACHE_ENABLED', 'false').lower() == 'true'  # Reuse unchanged animations across a chat's renders
+PARTIAL_CACHE_MAX_MB = int(os.getenv('PARTIAL_CACHE_MAX_MB', '2048'))  # Total size of all sessions' partial movies
+PARTIAL_CACHE_SESSION_MAX_MB = int(os.getenv('PARTIAL_CACHE_SESSION_MAX_MB', '512'))  # Size of one session's partial movies
+
+# Semantic Response Cache Configuration
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+SEMANTIC_CACHE_PATH = os.getenv('SEMANTIC_CACHE_PATH', os.path.join('cache', 'semantic_cache.json'))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))  # Cosine similarity needed for a hit
+SEMANTIC_CACHE_TTL = int(os.getenv('SEMANTIC_CACHE_TTL', str(7 * 24 * 3600)))  # Seconds before an answer expires
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '500'))  # LRU limit
+
+# Chat Session Configuration
+CHAT_SESSIONS_ENABLED = os.getenv('CHAT_SESSIONS_ENABLED', 'true').lower() == 'true'  # Follow-ups edit the chat's current code without retrieval
+CHAT_SESSION_MAX = int(os.getenv('CHAT_SESSION_MAX', '500'))  # Chats kept in memory (LRU)
+CHAT_SESSION_IDLE_SECONDS = int(os.getenv('CHAT_SESSION_IDLE_SECONDS', '3600'))  # Idle chats are forgotten after this
+CHAT_SESSION_MAX_CONTEXT_TOKENS = int(os.getenv('CHAT_SESSION_MAX_CONTEXT_TOKENS', '16384'))  # Longer model contexts are dropped
+
+# Ingestion Configuration
+INGEST_EMBED_BATCH_SIZE = int(os.getenv('INGEST_EMBED_BATCH_SIZE', '96'))  # Passages per embed request
+INGEST_UPSERT_BATCH_SIZE = int(os.getenv('INGEST_UPSERT_BATCH_SIZE', '100'))  # Vectors per upsert request
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))  # Embed/upsert batches in flight at once
+INGEST_STATE_DIR = os.getenv('INGEST_STATE_DIR', str(current_dir / 'ingest_state'))  # Content hashes from the last run
+
+# Explanation Configuration
+EXPLANATION_WORKERS = int(os.getenv('EXPLANATION_WORKERS', '2'))  # Explanations generated at once
+EXPLANATION_MAX_ENTRIES = int(os.getenv('EXPLANATION_MAX_ENTRIES', '200'))  # Explanations kept in memory and on disk (LRU)
+EXPLANATION_CACHE_PATH = os.getenv('EXPLANATION_CACHE_PATH', os.path.join('cache', 'explanations.json'))  # Finished explanations persisted here
+EXPLANATION_JOIN_TIMEOUT = int(os.getenv('EXPLANATION_JOIN_TIMEOUT', '120'))  # Seconds /visualize waits for it after the render
+SPECULATIVE_EXPLANATION = os.getenv('SPECULATIVE_EXPLANATION', 'false').lower() == 'true'  # Start explaining at /process time
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import config
+from pipeline_2 import stream_explanation
+
+
+def explanation_id(user_request):
+    """Stable id for the explanation of a request (it depends only on the request text)."""
+    normalized = ' '.join(user_request.split()).lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+class ExplanationStore:
+    """
+    Explanations of user requests, generated in the background and cached.
+
+    Explanations only depend on the user's request, so they can start as soon
+    as the request is known (even speculatively from /process) and serve every
+    later render of it, at any quality. Starting the same request twice reuses
+    the first run. Text is collected as the model writes it so clients can
+    follow() it live. The most recent `max_entries` explanations are kept and
+    finished ones are written to `path`, so they survive restarts; entries
+    written by a different `model` are ignored on load. Failed explanations
+    are not cached: the next start() retries.
+    """
+
+    def __init__(self, path=None, model=None, max_workers=2, max_entries=200):
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='explain')
+        self._entries = OrderedDict()  # explanation id -> entry dict, least recently used first
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # notified when any entry gets text or finishes
+        self._save_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'failures': 0, 'loaded': 0}
+        self._load()
+
+    @staticmethod
+    def _new_entry(user_request, started_at=None):
+        return {
+            'request': user_request,
+            'future': None,
+            'parts': [],  # text in the order the model wrote it
+            'error': None,
+            'cached': False,  # loaded from disk
+            'started_at': started_at or time.time(),
+            'finished_at': None,
+        }
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not load explanations from {self.path}: {e}")
+            return
+        for item in saved[-self.max_entries:]:
+            if self.model and item.get('model') != self.model:
+                continue
+            entry = self._new_entry(item['request'], started_at=item['created_at'])
+            entry.update(parts=[item['explanation']], cached=True, finished_at=item['created_at'])
+            entry['future'] = Future()
+            entry['future'].set_result(item['explanation'])
+            self._entries[item['key']] = entry
+        self.stats['loaded'] = len(self._entries)
+        print(f"📦 Loaded {len(self._entries)} cached explanations from {self.path}")
+
+    def _save(self):
+        """Write the finished explanations atomically, least recently used first."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                saved = [{
+                    'key': key,
+                    'request': entry['request'],
+                    'model': self.model,
+                    'explanation': ''.join(entry['parts']),
+                    'created_at': entry['finished_at'],
+                } for key, entry in self._entries.items() if entry['finished_at'] and not entry['error']]
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(saved, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"⚠️ Could not save explanations to {self.path}: {e}")
+
+    def start(self, user_request, manim_code=None):
+        """
+        Start explaining `user_request` unless it is cached or already running.
+        Returns its id. (manim_code is accepted for compatibility; explanations
+        don't depend on it.)
+        """
+        key = explanation_id(user_request)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry['error']:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return key
+            entry = self._entries[key] = self._new_entry(user_request)
+            self._entries.move_to_end(key)
+            self.stats['misses'] += 1
+            entry['future'] = self._executor.submit(self._explain, key, entry)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        print(f"📚 Started explanation {key} in the background")
+        return key
+
+    def _explain(self, key, entry):
+        """Stream the explanation into its entry. Returns the full text (or an error message)."""
+        error = None
+        try:
+            for text in stream_explanation(entry['request']):
+                with self._changed:
+                    entry['parts'].append(text)
+                    self._changed.notify_all()
+            if not ''.join(entry['parts']).strip():
+                raise ValueError('the model returned an empty explanation')
+        except Exception as e:
+            print(f"❌ Error generating explanation {key}: {e}")
+            error = str(e)
+
+        with self._changed:
+            entry['error'] = error
+            entry['finished_at'] = time.time()
+            if error:
+                self.stats['failures'] += 1
+            self._changed.notify_all()
+        if error:
+            return f"Unable to generate explanation. Error: {error}"
+
+        explanation = ''.join(entry['parts'])
+        print(f"✓ Explanation {key} generated ({len(explanation)} characters)")
+        self._save()
+        return explanation
+
+    def get(self, key):
+        """Return the entry dict for an explanation id, or None."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def result(self, key, timeout=None):
+        """Wait for an explanation. Returns None if unknown or not done within `timeout`."""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        try:
+            return entry['future'].result(timeout=timeout)
+        except Exception:
+            return None
+
+    def follow(self, key, idle_timeout=15):
+        """
+        Yield an explanation's text as it is written: everything so far, then
+        each new piece until it finishes. Yields None after `idle_timeout`
+        seconds without new text so callers can send keep-alives.
+        """
+        entry = self.get(key)
+        if entry is None:
+            return
+        sent = 0
+        while True:
+            with self._changed:
+                if sent >= len(entry['parts']) and entry['finished_at'] is None:
+                    self._changed.wait(timeout=idle_timeout)
+                parts = entry['parts'][sent:]
+                finished = entry['finished_at'] is not None
+            sent += len(parts)
+            if parts:
+                yield ''.join(parts)
+            elif not finished:
+                yield None
+            if finished:
+                return
+
+    def describe(self, key):
+        """Status dict for the /explanations endpoint."""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        with self._lock:
+            text = ''.join(entry['parts'])
+            finished = entry['finished_at'] is not None
+            info = {
+                'explanation_id': key,
+                'status': ('failed' if entry['error'] else 'completed') if finished else 'running',
+                'cached': entry['cached'],
+                'elapsed': round((entry['finished_at'] or time.time()) - entry['started_at'], 2),
+            }
+            if entry['error']:
+                info['error'] = entry['error']
+        if finished:
+            info['explanation'] = entry['future'].result()
+        else:
+            info['partial_explanation'] = text
+        return info
+
+    def describe_cache(self):
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'path': self.path,
+            **self.stats,
+        }
+
+
+explanation_store = ExplanationStore(
+    path=config.EXPLANATION_CACHE_PATH,
+    model=config.EXPLANATION_MODEL,
+    max_workers=config.EXPLANATION_WORKERS,
+    max_entries=config.EXPLANATION_MAX_ENTRIES,
+)
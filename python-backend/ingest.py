@@ -0,0 +1,345 @@
+"""
+Build or refresh the template index that search_rag reads.
+
+Reads the dataset in config.DOCS_FOLDER, splits it into chunks of
+config.CHUNK_SIZE characters (config.CHUNK_OVERLAP overlap), and only
+re-embeds chunks whose content hash changed since the last run. Embedding
+and upsert calls are batched and run with bounded parallelism.
+
+Usage:
+    python ingest.py                      # refresh the index for config.RAG_BACKEND
+    python ingest.py --target local       # build the in-process index instead
+    python ingest.py --full               # ignore saved hashes and re-embed everything
+    python ingest.py --dry-run            # only report what would change
+    python ingest.py --prune              # also delete Pinecone vectors this script didn't write
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import config
+
+
+TEXT_EXTENSIONS = {'.py', '.md', '.txt', '.rst'}
+
+
+def chunk_text(text, size=config.CHUNK_SIZE, overlap=config.CHUNK_OVERLAP):
+    """Split text into overlapping chunks, preferring to break at a newline."""
+    if len(text) <= size:
+        return [text] if text.strip() else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Break at the last newline in the second half of the window
+            newline = text.rfind('\n', start + size // 2, end)
+            if newline != -1:
+                end = newline + 1
+        chunk = text[start:end]
+        if chunk.strip():
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def iter_records(docs_folder):
+    """
+    Yield (filename, record_index, instruction, response) from the dataset.
+
+    .json files hold a record or a list of records and .jsonl files one
+    record per line, each with `instruction` and `response` (the Manim code).
+    Other text files are treated as a single record with no instruction.
+    """
+    for path in sorted(Path(docs_folder).rglob('*')):
+        if not path.is_file():
+            continue
+        filename = str(path.relative_to(docs_folder)).replace('\\', '/')
+        suffix = path.suffix.lower()
+        try:
+            if suffix == '.json':
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+                records = data if isinstance(data, list) else [data]
+                for i, record in enumerate(records):
+                    yield filename, i, record.get('instruction', ''), record.get('response', '')
+            elif suffix == '.jsonl':
+                with open(path, encoding='utf-8') as f:
+                    for i, line in enumerate(f):
+                        if line.strip():
+                            record = json.loads(line)
+                            yield filename, i, record.get('instruction', ''), record.get('response', '')
+            elif suffix in TEXT_EXTENSIONS:
+                yield filename, 0, '', path.read_text(encoding='utf-8')
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {filename}: {e}")
+
+
+def iter_chunks(docs_folder, embedding_model):
+    """
+    Yield chunk dicts with a stable id, the text to embed, metadata and content hash.
+
+    The full record (instruction and response) is stored once per document, in
+    the metadata of its first chunk; every chunk names that chunk as `doc_id`
+    so search_rag can look the record up from a match on any of them.
+    """
+    for filename, record_index, instruction, response in iter_records(docs_folder):
+        text = f"{instruction}\n\n{response}".strip() if instruction else response
+        doc_id = f"{filename}#{record_index}#0"
+        for chunk_index, chunk in enumerate(chunk_text(text)):
+            content_hash = hashlib.sha256(
+                f"{embedding_model}\0{chunk}\0{instruction}\0{response}".encode('utf-8')
+            ).hexdigest()
+            metadata = {'filename': filename, 'doc_id': doc_id, 'chunk': chunk_index}
+            if chunk_index == 0:
+                metadata['instruction'] = instruction
+                metadata['response'] = response
+            yield {
+                'id': f"{filename}#{record_index}#{chunk_index}",
+                'text': chunk,
+                'hash': content_hash,
+                'metadata': metadata,
+            }
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def make_embedder(provider, model):
+    """Return a function embedding a list of passages in one call (or one batch)."""
+    if provider == 'pinecone':
+        from pipeline_2 import get_pinecone_client, with_retries
+        pc = get_pinecone_client()
+
+        def embed(texts):
+            response = with_retries(
+                lambda: pc.inference.embed(
+                    model=model,
+                    inputs=texts,
+                    parameters={"input_type": "passage", "truncate": "END"}
+                ),
+                "Pinecone embed"
+            )
+            return [item['values'] for item in response]
+        return embed
+
+    if provider == 'ollama':
+        import ollama
+
+        def embed(texts):
+            # This Ollama client embeds one prompt per request
+            vectors = [ollama.embeddings(model=model, prompt=text)['embedding'] for text in texts]
+            if vectors and len(vectors[0]) != config.VECTOR_DIMENSION:
+                print(f"⚠️ {model} returned {len(vectors[0])}-dim vectors, "
+                      f"config.VECTOR_DIMENSION is {config.VECTOR_DIMENSION}")
+            return vectors
+        return embed
+
+    raise ValueError(f"Unknown embedding provider: {provider}")
+
+
+class PineconeTarget:
+    """Upserts/deletes vectors in the configured Pinecone index."""
+
+    def __init__(self):
+        from pipeline_2 import get_pinecone_index, with_retries
+        self.index = get_pinecone_index()
+        self.with_retries = with_retries
+
+    def upsert(self, chunks, vectors):
+        for batch in batched(list(zip(chunks, vectors)), config.INGEST_UPSERT_BATCH_SIZE):
+            self.with_retries(
+                lambda: self.index.upsert(vectors=[
+                    {'id': chunk['id'], 'values': vector, 'metadata': chunk['metadata']}
+                    for chunk, vector in batch
+                ]),
+                "Pinecone upsert"
+            )
+
+    def delete(self, ids):
+        for batch in batched(ids, 1000):
+            self.with_retries(lambda: self.index.delete(ids=batch), "Pinecone delete")
+
+    def existing_ids(self):
+        """Every id in the index, or None when it can't be listed (pod-based indexes)."""
+        try:
+            return {vector_id for page in self.index.list() for vector_id in page}
+        except Exception as e:
+            print(f"⚠️ Could not list the index ({e}); vectors this script didn't write won't be removed")
+            return None
+
+    def commit(self, keep_ids):
+        pass
+
+
+class LocalTarget:
+    """Collects changes and rewrites the local index once at the end."""
+
+    def __init__(self, index_dir, dtype, embedding):
+        from local_index import LocalVectorIndex, MANIFEST_FILE
+        self.index_dir = index_dir
+        self.dtype = dtype
+        self.embedding = embedding
+        self.rows = {}  # id -> (vector, metadata)
+
+        if os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+            existing = LocalVectorIndex(index_dir)
+            if existing.embedding == embedding:
+                # Keep unchanged rows; stored vectors are already normalized
+                for row in range(len(existing)):
+                    record = existing.record(row)
+                    vector = np.asarray(existing.vectors[row], dtype=np.float32)
+                    if existing.scales is not None:
+                        vector = vector * existing.scales[row]
+                    self.rows[record['id']] = (vector, record['metadata'])
+            existing.close()
+
+    def upsert(self, chunks, vectors):
+        for chunk, vector in zip(chunks, vectors):
+            self.rows[chunk['id']] = (vector, chunk['metadata'])
+
+    def delete(self, ids):
+        for vector_id in ids:
+            self.rows.pop(vector_id, None)
+
+    def commit(self, keep_ids):
+        from local_index import write_index
+        ids = [vector_id for vector_id in self.rows if vector_id in keep_ids]
+        dimension = len(next(iter(self.rows.values()))[0]) if self.rows else 0
+        vectors = [self.rows[i][0] for i in ids] or np.zeros((0, dimension))
+        metadatas = [self.rows[i][1] for i in ids]
+        write_index(self.index_dir, ids, vectors, metadatas, dtype=self.dtype, embedding=self.embedding)
+
+
+def load_state(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def ingest(target='pinecone', provider=None, full=False, dry_run=False, prune=False):
+    """
+    Embed new/changed chunks into the target index and drop removed ones.
+
+    With `prune`, every Pinecone vector whose id isn't one of the current
+    chunks is deleted too (e.g. vectors left by an older ingestion). Raises
+    ValueError when the dataset has no chunks, so a missing DOCS_FOLDER can't
+    empty the index.
+    """
+    start_time = time.time()
+    if provider is None:
+        provider = 'pinecone' if target == 'pinecone' else 'ollama'
+    model = config.EMBEDDING_MODEL if provider == 'pinecone' else config.OLLAMA_EMBEDDING_MODEL
+    if target == 'pinecone' and provider != 'pinecone':
+        raise ValueError('The Pinecone index must be embedded with Pinecone to match query embeddings')
+
+    state_path = os.path.join(config.INGEST_STATE_DIR, f"{target}_{provider}.json")
+    previous = {} if full else load_state(state_path)
+
+    print("="*80)
+    print(f"INGESTING {config.DOCS_FOLDER} -> {target} ({provider}:{model})")
+    print("="*80)
+
+    if target == 'local':
+        sink = LocalTarget(config.LOCAL_INDEX_DIR, config.LOCAL_INDEX_DTYPE,
+                           {'provider': provider, 'model': model})
+        # Only trust hashes for rows the local index actually still has
+        previous = {chunk_id: h for chunk_id, h in previous.items() if chunk_id in sink.rows}
+        existing = None
+    else:
+        sink = PineconeTarget()
+        existing = None
+        if prune:
+            # Diff against what the index actually holds, so vectors from older
+            # ingestions (with other ids) are removed instead of duplicating templates
+            existing = sink.existing_ids()
+            if existing is not None:
+                previous = {chunk_id: h for chunk_id, h in previous.items() if chunk_id in existing}
+
+    current = {}
+    changed = []
+    for chunk in iter_chunks(config.DOCS_FOLDER, model):
+        current[chunk['id']] = chunk['hash']
+        if previous.get(chunk['id']) != chunk['hash']:
+            changed.append(chunk)
+    if not current:
+        raise ValueError(f"No chunks found in {config.DOCS_FOLDER}; refusing to update the index")
+    removed = [chunk_id for chunk_id in previous if chunk_id not in current]
+    if existing:
+        removed += sorted(existing - set(current) - set(removed))
+
+    print(f"Chunks: {len(current)} total, {len(changed)} new/changed, {len(removed)} removed")
+    if dry_run:
+        return {'total': len(current), 'changed': len(changed), 'removed': len(removed)}
+
+    embed = make_embedder(provider, model)
+    done = dict((chunk_id, h) for chunk_id, h in previous.items() if chunk_id in current)
+
+    def process(batch):
+        vectors = embed([chunk['text'] for chunk in batch])
+        sink.upsert(batch, vectors)
+        return batch
+
+    # Bounded parallelism: at most INGEST_WORKERS batches in flight
+    embedded = 0
+    with ThreadPoolExecutor(max_workers=config.INGEST_WORKERS) as executor:
+        for batch in executor.map(process, batched(changed, config.INGEST_EMBED_BATCH_SIZE)):
+            for chunk in batch:
+                done[chunk['id']] = chunk['hash']
+            embedded += len(batch)
+            print(f"   Embedded {embedded}/{len(changed)} chunks")
+            if target == 'pinecone':
+                # Upserts are already live, so record progress in case we're interrupted
+                save_state(state_path, done)
+
+    if removed:
+        sink.delete(removed)
+    if changed or removed:
+        sink.commit(current)
+    save_state(state_path, current)
+
+    elapsed = time.time() - start_time
+    print(f"✅ Ingestion finished in {elapsed:.1f}s")
+    return {'total': len(current), 'changed': len(changed), 'removed': len(removed), 'elapsed': elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or refresh the RAG template index")
+    parser.add_argument('--target', choices=['pinecone', 'local'], default=config.RAG_BACKEND)
+    parser.add_argument('--provider', choices=['pinecone', 'ollama'], default=None,
+                        help="Embedding provider (default: pinecone for Pinecone, ollama for local)")
+    parser.add_argument('--full', action='store_true', help="Re-embed every chunk")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would change")
+    parser.add_argument('--prune', action='store_true',
+                        help="Delete Pinecone vectors whose ids this script didn't write")
+    args = parser.parse_args()
+
+    ingest(target=args.target, provider=args.provider, full=args.full, dry_run=args.dry_run,
+           prune=args.prune)
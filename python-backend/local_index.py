@@ -0,0 +1,220 @@
+import json
+import mmap
+import os
+import sys
+import threading
+
+import numpy as np
+
+import config
+
+
+MANIFEST_FILE = 'manifest.json'
+VECTORS_FILE = 'vectors.npy'
+SCALES_FILE = 'scales.npy'
+OFFSETS_FILE = 'offsets.npy'
+METADATA_FILE = 'metadata.jsonl'
+
+# Rows scored per block, so float16/int8 data is upcast a slice at a time
+BLOCK_ROWS = 65536
+
+# Corpora whose float32 form fits in this many bytes are upcast once and kept
+# in memory, trading a little RAM for skipping the per-query conversion
+DENSE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def write_index(index_dir, ids, vectors, metadatas, dtype='float16', embedding=None):
+    """
+    Write a local index to `index_dir`.
+
+    Vectors are L2-normalized (so a dot product is cosine similarity) and
+    stored as float16, or as int8 with one float32 scale per row. Metadata
+    goes to a JSON-lines file with a byte-offset table so single records can
+    be read without loading the rest. `embedding` describes how the vectors
+    were produced ({'provider': 'pinecone' | 'ollama', 'model': ...}) so
+    queries are embedded the same way.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2 or len(matrix) != len(ids) or len(ids) != len(metadatas):
+        raise ValueError('ids, vectors and metadatas must have matching lengths')
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+
+    if dtype == 'int8':
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        np.save(os.path.join(index_dir, VECTORS_FILE), quantized)
+        np.save(os.path.join(index_dir, SCALES_FILE), scales.astype(np.float32))
+    elif dtype == 'float16':
+        np.save(os.path.join(index_dir, VECTORS_FILE), matrix.astype(np.float16))
+    else:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    offsets = []
+    with open(os.path.join(index_dir, METADATA_FILE), 'wb') as f:
+        for vector_id, metadata in zip(ids, metadatas):
+            offsets.append(f.tell())
+            record = {'id': vector_id, 'metadata': metadata}
+            f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        offsets.append(f.tell())
+    np.save(os.path.join(index_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+    manifest = {
+        'count': len(ids),
+        'dimension': int(matrix.shape[1]) if len(matrix) else 0,
+        'dtype': dtype,
+        'embedding': embedding or {'provider': 'pinecone', 'model': config.EMBEDDING_MODEL},
+    }
+    with open(os.path.join(index_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"✓ Wrote local index with {len(ids)} vectors ({dtype}) to {index_dir}")
+    return manifest
+
+
+class LocalVectorIndex:
+    """
+    In-process, memory-mapped replacement for the Pinecone index.
+
+    `query` returns the same shape as Pinecone's ({'matches': [{'id', 'score',
+    'metadata'}]}) so search_rag can use either backend.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        self.vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode='r')
+        scales_path = os.path.join(index_dir, SCALES_FILE)
+        self.scales = np.load(scales_path, mmap_mode='r') if self.manifest['dtype'] == 'int8' else None
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+
+        self._dense = None
+        if self.vectors.size * 4 <= DENSE_CACHE_BYTES:
+            self._dense = np.asarray(self.vectors, dtype=np.float32)
+            if self.scales is not None:
+                self._dense = self._dense * np.asarray(self.scales)[:, None]
+
+        self._metadata_file = open(os.path.join(index_dir, METADATA_FILE), 'rb')
+        self._metadata = None
+        self._rows_by_id = None  # built on the first fetch_metadata
+        if os.path.getsize(self._metadata_file.name):
+            self._metadata = mmap.mmap(self._metadata_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def embedding(self):
+        return self.manifest['embedding']
+
+    def record(self, row):
+        """Read one id/metadata record from the side store."""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._metadata[start:end])
+
+    def fetch_metadata(self, ids):
+        """Metadata of the rows with the given ids (unknown ids are left out)."""
+        if self._rows_by_id is None:
+            self._rows_by_id = {self.record(row)['id']: row for row in range(len(self))}
+        return {vector_id: self.record(self._rows_by_id[vector_id])['metadata']
+                for vector_id in ids if vector_id in self._rows_by_id}
+
+    def scores(self, vector):
+        """Cosine similarity of `vector` against every stored row."""
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape[0] != self.vectors.shape[1]:
+            raise ValueError(
+                f"Query has dimension {query.shape[0]}, index has {self.vectors.shape[1]}"
+            )
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        if self._dense is not None:
+            return self._dense @ query
+
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def query(self, vector, top_k=1, include_metadata=True, **kwargs):
+        if not len(self.vectors):
+            return {'matches': []}
+
+        scores = self.scores(vector)
+        top_k = min(top_k, len(scores))
+        # argpartition finds the top k in O(n); only those k get sorted
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for row in top:
+            record = self.record(int(row))
+            match = {'id': record['id'], 'score': float(scores[row])}
+            if include_metadata:
+                match['metadata'] = record['metadata']
+            matches.append(match)
+        return {'matches': matches}
+
+    def close(self):
+        if self._metadata is not None:
+            self._metadata.close()
+        self._metadata_file.close()
+
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index():
+    """Return the process-wide LocalVectorIndex, loading it on first use."""
+    global _local_index
+    if _local_index is None:
+        with _local_index_lock:
+            if _local_index is None:
+                _local_index = LocalVectorIndex(config.LOCAL_INDEX_DIR)
+                print(f"📦 Loaded local index with {len(_local_index)} vectors from {config.LOCAL_INDEX_DIR}")
+    return _local_index
+
+
+def export_from_pinecone(index_dir=None, dtype=None, batch_size=100):
+    """Copy every vector and its metadata out of the Pinecone index into a local index."""
+    from pipeline_2 import get_pinecone_index
+
+    index_dir = index_dir or config.LOCAL_INDEX_DIR
+    dtype = dtype or config.LOCAL_INDEX_DTYPE
+    index = get_pinecone_index()
+
+    ids, vectors, metadatas = [], [], []
+    for id_page in index.list():
+        page = list(id_page)
+        for start in range(0, len(page), batch_size):
+            fetched = index.fetch(ids=page[start:start + batch_size])
+            for vector_id, vector in fetched.vectors.items():
+                ids.append(vector_id)
+                vectors.append(vector.values)
+                metadatas.append(dict(vector.metadata or {}))
+        print(f"   Exported {len(ids)} vectors...")
+
+    return write_index(
+        index_dir, ids, vectors, metadatas, dtype=dtype,
+        embedding={'provider': 'pinecone', 'model': config.EMBEDDING_MODEL}
+    )
+
+
+if __name__ == "__main__":
+    # python local_index.py export [float16|int8]
+    if len(sys.argv) >= 2 and sys.argv[1] == 'export':
+        export_from_pinecone(dtype=sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        print("Usage: python local_index.py export [float16|int8]")
@@ -3,8 +3,24 @@ import os
 import tempfile
 import shutil
 from pathlib import Path
-import re
 import sys
+import threading
+
+import config
+from render_index import render_index
+from render_logs import render_logs, count_animations
+from preflight import validate_code
+from video_packaging import package_video
+
+
+# Folder manim writes each quality's movie to: videos/<module>/<folder>/<name>.mp4
+QUALITY_DIRS = {
+    'l': '480p15',
+    'm': '720p30',
+    'h': '1080p60',
+    'p': '1440p60',
+    'k': '2160p60',
+}
 
 
 def get_manim_executable():
@@ -37,17 +53,17 @@ def get_manim_executable():
 
 
 def extract_scene_class_name(code):
-    """Extract the Scene class name from Manim code."""
-    # Look for class definitions that inherit from Scene
-    pattern = r'class\s+(\w+)\s*\([^)]*Scene[^)]*\):'
-    matches = re.findall(pattern, code)
-    
-    if matches:
-        return matches[0]
+    """Extract the first renderable Scene class name from Manim code."""
+    # Parsed with ast, so classes in strings/comments don't count and
+    # indirect subclasses (class Demo(MyBaseScene)) do
+    scenes = validate_code(code, allowed_imports=(), blocked_calls=())['scenes']
+    if scenes:
+        return scenes[0]
     return None
 
 
-def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
+def render_manim_scene(code, output_dir="renders", quality="l", preview=False, output_name=None,
+                       cache_partials=False, scene_name=None, log=None, module_name='scene'):
     """
     Render Manim code and return the path to the generated MP4 file.
     
@@ -56,16 +72,26 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
         output_dir (str): Directory to store rendered videos
         quality (str): Quality flag - 'l' (low), 'm' (medium), 'h' (high)
         preview (bool): Whether to open preview after rendering
+        output_name (str): Base name for the output file (e.g. a content hash).
+            Defaults to the scene name plus a timestamp.
+        cache_partials (bool): Keep manim's per-animation cache in output_dir so
+            later renders from the same directory only redo changed animations.
+        scene_name (str): Scene class to render. Defaults to the first one in the code.
+        log (RenderLog): Where manim's output and progress go. Defaults to a
+            new log named after the render.
+        module_name (str): File name (without .py) the code is written to in
+            output_dir when cache_partials is set. Renders sharing output_dir
+            at the same time need different names.
     
     Returns:
-        dict: Contains success status, video path, and any error messages
+        dict: Contains success status, video path, log path, and any error messages
     """
     try:
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
         # Extract the scene class name
-        scene_name = extract_scene_class_name(code)
+        scene_name = scene_name or extract_scene_class_name(code)
         if not scene_name:
             return {
                 'success': False,
@@ -73,15 +99,25 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
                 'video_path': None
             }
         
-        # Create a timestamp-based unique identifier
-        import time
-        timestamp = int(time.time())
-        unique_id = f"{scene_name}_{timestamp}"
+        # Use the caller's name if given, otherwise a timestamp-based unique identifier
+        if output_name:
+            unique_id = f"{scene_name}_{output_name}"
+        else:
+            import time
+            timestamp = int(time.time())
+            unique_id = f"{scene_name}_{timestamp}"
         
-        # Create a temporary file for the code with a consistent name
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8', prefix=unique_id) as temp_file:
-            temp_file.write(code)
-            temp_file_path = temp_file.name
+        if cache_partials:
+            # manim stores partial movies under videos/<module name>/, so the
+            # file name has to stay the same between renders to hit the cache
+            temp_file_path = os.path.join(output_dir, f"{module_name}.py")
+            with open(temp_file_path, 'w', encoding='utf-8') as scene_file:
+                scene_file.write(code)
+        else:
+            # Create a temporary file for the code with a consistent name
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8', prefix=unique_id) as temp_file:
+                temp_file.write(code)
+                temp_file_path = temp_file.name
         
         print(f"\n🎬 Rendering Manim scene: {scene_name}")
         print(f"   Quality: {quality}, Preview: {preview}")
@@ -128,7 +164,7 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
                 "--media_dir", output_dir
             ]
         
-        if not preview:
+        if not preview and not cache_partials:
             command.append("--disable_caching")
         
         print(f"   Command: {' '.join(command)}")
@@ -136,19 +172,31 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
         print(f"Starting Manim rendering...")
         print(f"{'='*80}\n")
         
-        # Run manim command with real-time output
-        result = subprocess.run(
+        # Stream manim's output to the log instead of buffering all of it
+        owns_log = log is None
+        if owns_log:
+            log = render_logs.create(unique_id)
+        log.expect(count_animations(code, scene_name))
+        print(f"   Log: {log.path}")
+        process = subprocess.Popen(
             command,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            timeout=300  # 5 minute timeout for complex animations
+            errors='replace'
         )
-        
-        # Print Manim output for debugging
-        if result.stdout:
-            print(f"Manim STDOUT:\n{result.stdout}")
-        if result.stderr:
-            print(f"Manim STDERR:\n{result.stderr}")
+        reader = threading.Thread(target=log.consume, args=(process.stdout,), daemon=True)
+        reader.start()
+        try:
+            returncode = process.wait(timeout=config.RENDER_TIMEOUT)  # 5 minute default for complex animations
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            reader.join(timeout=5)
+            if owns_log:
+                log.close()
         
         # Clean up temp file
         try:
@@ -156,13 +204,15 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
         except:
             pass
         
-        if result.returncode != 0:
-            print(f"❌ Manim rendering failed with return code {result.returncode}!")
-            error_msg = result.stderr or result.stdout or "Unknown error"
+        if returncode != 0:
+            print(f"❌ Manim rendering failed with return code {returncode}!")
+            error_msg = log.error_text()
+            print(f"Manim output (last lines):\n{error_msg}")
             return {
                 'success': False,
                 'error': error_msg,
-                'video_path': None
+                'video_path': None,
+                'log_path': log.path
             }
         
         print(f"\n{'='*80}")
@@ -171,10 +221,12 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
         print(f"{'='*80}\n")
         
         # Find the generated video file
-        video_path = find_latest_video(output_dir, unique_id)
+        module_name = Path(temp_file_path).stem
+        video_path = find_latest_video(output_dir, unique_id, module_name=module_name, quality=quality)
         
         if video_path and os.path.exists(video_path):
             print(f"✅ Video rendered successfully: {video_path}")
+            record_render(video_path, scene_name, quality, keep_partials=cache_partials)
             file_size = os.path.getsize(video_path)
             print(f"   File size: {file_size / 1024:.2f} KB")
             return {
@@ -182,17 +234,17 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
                 'video_path': video_path,
                 'scene_name': scene_name,
                 'unique_id': unique_id,
-                'output': result.stdout
+                'log_path': log.path
             }
         else:
             print(f"❌ Video file not found after rendering!")
             print(f"   Expected to find video matching: {unique_id}")
-            print(f"   In directory: {output_dir}/videos")
+            print(f"   In directory: {output_dir}/videos/{module_name}")
             
-            # List what files we actually have
-            videos_dir = Path(output_dir) / "videos"
-            if videos_dir.exists():
-                all_videos = list(videos_dir.rglob("*.mp4"))
+            # List what files this render actually produced
+            module_dir = Path(output_dir) / "videos" / module_name
+            if module_dir.exists():
+                all_videos = list(module_dir.rglob("*.mp4"))
                 print(f"   Found {len(all_videos)} video files:")
                 for v in all_videos[:5]:  # Show first 5
                     print(f"     - {v}")
@@ -201,13 +253,13 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
                 'success': False,
                 'error': 'Video file not found after rendering',
                 'video_path': None,
-                'output': result.stdout
+                'log_path': log.path
             }
     
     except subprocess.TimeoutExpired:
         return {
             'success': False,
-            'error': 'Rendering timeout (exceeded 2 minutes)',
+            'error': f'Rendering timeout (exceeded {config.RENDER_TIMEOUT} seconds)',
             'video_path': None
         }
     except Exception as e:
@@ -220,79 +272,45 @@ def render_manim_scene(code, output_dir="renders", quality="l", preview=False):
             'video_path': None
         }
 
-def find_latest_video(output_dir, search_name):
-    """Find the most recently created video file for a scene."""
-    videos_dir = Path(output_dir) / "videos"
+def find_latest_video(output_dir, search_name, module_name=None, quality=None):
+    """
+    Find the video manim wrote for a render.
+
+    The path is predictable from the module name and quality, so this is a
+    single stat; if manim used an unexpected resolution folder only this
+    render's own module directory is searched.
+    """
+    if not module_name:
+        return None
+    module_dir = Path(output_dir) / "videos" / module_name
     
-    # Search for mp4 files with the search name
-    if videos_dir.exists():
-        video_files = list(videos_dir.rglob(f"*{search_name}*.mp4"))
-        # Exclude partial movie files
-        video_files = [vf for vf in video_files if 'partial_movie_files' not in str(vf)]
+    expected = module_dir / QUALITY_DIRS.get(quality, '') / f"{search_name}.mp4"
+    if expected.is_file():
+        return str(expected)
+    
+    if module_dir.exists():
+        video_files = [vf for vf in module_dir.glob(f"*/{search_name}.mp4")]
         if video_files:
             # Return the most recently modified file
             latest_video = max(video_files, key=lambda p: p.stat().st_mtime)
             return str(latest_video)
     
     return None
-    return None
 
 
-def cleanup_old_renders(output_dir, keep_last_n=10):
-    """Clean up old rendered videos to save space."""
+def record_render(video_path, scene_name, quality, keep_partials=False):
+    """Package a finished video, add it to the render index and drop its partial movie files."""
+    package_video(video_path)
     try:
-        videos_dir = Path(output_dir) / "videos"
-        if not videos_dir.exists():
-            return
-        
-        # Find all mp4 files, excluding partial_movie_files
-        video_files = []
-        for video_file in videos_dir.rglob("*.mp4"):
-            # Skip files in partial_movie_files directories
-            if "partial_movie_files" in str(video_file):
-                continue
-            video_files.append(video_file)
-        
-        if len(video_files) > keep_last_n:
-            # Sort by modification time (newest first)
-            video_files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
-            
-            # Delete older files and their parent directories
-            for old_file in video_files[keep_last_n:]:
-                try:
-                    # Delete the video file
-                    old_file.unlink()
-                    print(f"🗑️ Deleted old render: {old_file}")
-                    
-                    # Try to remove empty parent directories (temp folder structure)
-                    parent = old_file.parent
-                    try:
-                        if parent.exists() and not any(parent.iterdir()):
-                            parent.rmdir()
-                            print(f"🗑️ Removed empty directory: {parent}")
-                            # Try to remove grandparent if also empty
-                            grandparent = parent.parent
-                            if grandparent != videos_dir and grandparent.exists() and not any(grandparent.iterdir()):
-                                grandparent.rmdir()
-                                print(f"🗑️ Removed empty directory: {grandparent}")
-                    except:
-                        pass  # Ignore errors removing empty dirs
-                except Exception as e:
-                    print(f"Warning: Could not delete {old_file}: {e}")
-        
-        # Separately clean up partial_movie_files directories ONLY (not their parents)
-        partial_dirs = list(videos_dir.rglob("partial_movie_files"))
-        for partial_dir in partial_dirs:
-            try:
-                import shutil
-                if partial_dir.exists():
-                    shutil.rmtree(partial_dir)
-                    print(f"🗑️ Cleaned up partial files: {partial_dir}")
-            except Exception as e:
-                print(f"Warning: Could not delete partial directory {partial_dir}: {e}")
-                
+        render_index.record(video_path, scene=scene_name, quality=quality)
     except Exception as e:
-        print(f"Warning: Failed to cleanup old renders: {e}")
+        print(f"Warning: Could not index render {video_path}: {e}")
+    
+    if not keep_partials:
+        # manim leaves the per-animation clips next to the final movie
+        partial_dir = Path(video_path).parent / "partial_movie_files"
+        if partial_dir.exists():
+            shutil.rmtree(partial_dir, ignore_errors=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+import threading
+from collections import deque
+
+import config
+
+
+class ModelRouter:
+    """
+    Picks which model tier handles a code generation request.
+
+    Tiers are ordered smallest (fastest) to largest. A request starts on the
+    largest tier when it looks hard: a weak retrieval match, a long prompt or
+    a long template. Otherwise it starts on the smallest tier whose recent
+    success rate is at least `min_success_rate` (judged once it has
+    `min_samples` recent outcomes); a skipped tier still gets
+    every `probe_every`-th request so its rate can recover. The caller checks
+    each output and escalates to the next tier when it fails.
+    """
+
+    def __init__(self, tiers, enabled=True, min_score=0.75, max_prompt_chars=400,
+                 max_template_chars=6000, min_success_rate=0.6, min_samples=5, history=50,
+                 probe_every=10):
+        self.tiers = list(tiers)
+        self.enabled = enabled
+        self.min_score = min_score
+        self.max_prompt_chars = max_prompt_chars
+        self.max_template_chars = max_template_chars
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+        self._lock = threading.Lock()
+        self._outcomes = {model: deque(maxlen=history) for model in self.tiers}
+        self._skipped = {model: 0 for model in self.tiers}
+        self._models = {}  # model -> counters and recent latencies
+
+    @property
+    def largest(self):
+        return self.tiers[-1]
+
+    def _model_stats(self, model):
+        return self._models.setdefault(model, {
+            'routed': 0,
+            'calls': 0,
+            'failures': 0,
+            'escalations': 0,
+            'latencies': deque(maxlen=50),
+        })
+
+    def success_rate(self, model):
+        """Share of the model's recent outputs that passed validation, or None without enough data."""
+        with self._lock:
+            outcomes = self._outcomes.get(model)
+            if not outcomes or len(outcomes) < self.min_samples:
+                return None
+            return sum(outcomes) / len(outcomes)
+
+    def too_hard(self, retrieval_score=None, prompt='', template=''):
+        """Reason a request should skip the small tiers, or None."""
+        if retrieval_score is not None and retrieval_score < self.min_score:
+            return f"retrieval score {retrieval_score:.2f} < {self.min_score}"
+        if len(prompt) > self.max_prompt_chars:
+            return f"prompt is {len(prompt)} characters"
+        if len(template) > self.max_template_chars:
+            return f"template is {len(template)} characters"
+        return None
+
+    def plan(self, retrieval_score=None, prompt='', template=''):
+        """Models to try in order: the starting tier and every larger one."""
+        if not self.enabled or len(self.tiers) == 1:
+            return [self.largest]
+
+        reason = self.too_hard(retrieval_score, prompt, template)
+        start = len(self.tiers) - 1
+        if not reason:
+            for index, model in enumerate(self.tiers[:-1]):
+                rate = self.success_rate(model)
+                if rate is None or rate >= self.min_success_rate:
+                    start = index
+                    break
+                with self._lock:
+                    self._skipped[model] += 1
+                    probe = self._skipped[model] % self.probe_every == 0
+                if probe:
+                    start = index
+                    break
+            else:
+                reason = 'small tiers are failing validation'
+
+        models = self.tiers[start:]
+        with self._lock:
+            self._model_stats(models[0])['routed'] += 1
+        print(f"🧭 Routing code generation to {models[0]}" + (f" ({reason})" if reason else ""))
+        return models
+
+    def record(self, model, seconds, success):
+        """Note one call's latency and whether its output passed validation."""
+        with self._lock:
+            stats = self._model_stats(model)
+            stats['calls'] += 1
+            stats['latencies'].append(seconds)
+            if not success:
+                stats['failures'] += 1
+            if model in self._outcomes:
+                self._outcomes[model].append(1 if success else 0)
+
+    def escalate(self, model, next_model, reason):
+        with self._lock:
+            self._model_stats(model)['escalations'] += 1
+        print(f"⤴️ Escalating from {model} to {next_model}: {reason}")
+
+    def describe(self):
+        with self._lock:
+            models = {}
+            for model, stats in self._models.items():
+                latencies = list(stats['latencies'])
+                outcomes = self._outcomes.get(model)
+                models[model] = {
+                    'routed': stats['routed'],
+                    'calls': stats['calls'],
+                    'failures': stats['failures'],
+                    'escalations': stats['escalations'],
+                    'escalation_rate': round(stats['escalations'] / stats['calls'], 3) if stats['calls'] else None,
+                    'recent_success_rate': round(sum(outcomes) / len(outcomes), 3) if outcomes else None,
+                    'avg_latency': round(sum(latencies) / len(latencies), 2) if latencies else None,
+                    'max_latency': round(max(latencies), 2) if latencies else None,
+                }
+        return {
+            'enabled': self.enabled,
+            'tiers': self.tiers,
+            'models': models,
+        }
+
+
+code_router = ModelRouter(
+    config.CODE_MODEL_TIERS,
+    enabled=config.MODEL_ROUTING_ENABLED,
+    min_score=config.ROUTER_MIN_SCORE,
+    max_prompt_chars=config.ROUTER_MAX_PROMPT_CHARS,
+    max_template_chars=config.ROUTER_MAX_TEMPLATE_CHARS,
+    min_success_rate=config.ROUTER_MIN_SUCCESS_RATE,
+    history=config.ROUTER_HISTORY,
+    probe_every=config.ROUTER_PROBE_EVERY,
+)
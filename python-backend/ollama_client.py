@@ -0,0 +1,199 @@
+import hashlib
+import json
+import threading
+import time
+
+import ollama
+
+import config
+
+
+class _Flight:
+    """One Ollama call shared by every caller that asked for it while it ran."""
+
+    def __init__(self):
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def wait(self):
+        """Block until the call finishes and return its result (or raise its error)."""
+        with self._cond:
+            while not self.done:
+                self._cond.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+    def follow(self):
+        """Yield every streamed chunk from the start, as they arrive."""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                batch = self.chunks[index:]
+                finished = self.done
+            index += len(batch)
+            yield from batch
+            if finished and index >= len(self.chunks):
+                if self.error:
+                    raise self.error
+                return
+
+
+class OllamaClient:
+    """
+    Shared front for the pipeline's Ollama calls.
+
+    - Every call passes `keep_alive`, so models stay loaded between requests
+      instead of unloading after Ollama's 5 minute default.
+    - At most `max_concurrent` calls run per model; the rest wait here rather
+      than piling up inside Ollama.
+    - Identical calls (same kind, model, prompt, context and options) made
+      while one is running share it: followers get the same result, or the
+      same streamed chunks from the beginning.
+    """
+
+    def __init__(self, host=None, keep_alive='30m', max_concurrent=2):
+        self.keep_alive = keep_alive
+        self.max_concurrent = max(1, max_concurrent)
+        self._client = ollama.Client(host=host)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # call key -> _Flight
+        self._slots = {}      # model -> BoundedSemaphore
+        self._models = {}     # model -> counters
+        self.preloaded = {}   # model -> seconds it took to load, or the error
+
+    def _model_stats(self, model):
+        return self._models.setdefault(model, {
+            'requests': 0,
+            'coalesced': 0,
+            'active': 0,
+            'waiting': 0,
+        })
+
+    def _slot(self, model):
+        with self._lock:
+            if model not in self._slots:
+                self._slots[model] = threading.BoundedSemaphore(self.max_concurrent)
+            return self._slots[model]
+
+    @staticmethod
+    def _key(kind, model, stream, payload):
+        raw = json.dumps([kind, model, stream, payload], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _call(self, kind, model, stream, **payload):
+        payload = {name: value for name, value in payload.items() if value is not None}
+        key = self._key(kind, model, stream, payload)
+        with self._lock:
+            stats = self._model_stats(model)
+            stats['requests'] += 1
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+            else:
+                stats['coalesced'] += 1
+        if not leader:
+            print(f"🔗 Joining identical in-flight {kind} call to {model}")
+
+        if leader and stream:
+            # Produce on a thread of its own so followers keep receiving
+            # chunks even if the first caller stops reading
+            threading.Thread(target=self._run, args=(key, flight, kind, model, stream, payload),
+                             name=f'ollama-{kind}', daemon=True).start()
+        elif leader:
+            self._run(key, flight, kind, model, stream, payload)
+        return flight.follow() if stream else flight.wait()
+
+    def _run(self, key, flight, kind, model, stream, payload):
+        stats = self._models[model]
+        slot = self._slot(model)
+        try:
+            with self._lock:
+                stats['waiting'] += 1
+            slot.acquire()
+            with self._lock:
+                stats['waiting'] -= 1
+                stats['active'] += 1
+            try:
+                call = getattr(self._client, kind)
+                if stream:
+                    for chunk in call(model=model, stream=True, keep_alive=self.keep_alive, **payload):
+                        flight.publish(chunk)
+                    flight.finish()
+                else:
+                    flight.finish(result=call(model=model, keep_alive=self.keep_alive, **payload))
+            finally:
+                slot.release()
+                with self._lock:
+                    stats['active'] -= 1
+        except Exception as e:
+            flight.finish(error=e)
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+
+    def generate(self, model, prompt='', system=None, context=None, stream=False, options=None):
+        """ollama.generate through the shared client (see class docstring)."""
+        return self._call('generate', model, stream, prompt=prompt, system=system,
+                          context=list(context) if context else None, options=options)
+
+    def chat(self, model, messages, stream=False, options=None):
+        """ollama.chat through the shared client."""
+        return self._call('chat', model, stream, messages=messages, options=options)
+
+    def embeddings(self, model, prompt):
+        """ollama.embeddings through the shared client."""
+        return self._call('embeddings', model, False, prompt=prompt)
+
+    def preload(self, models):
+        """
+        Load each model into memory ahead of the first request (an empty
+        prompt makes Ollama load the model without generating anything).
+        """
+        for model in dict.fromkeys(models):
+            start_time = time.time()
+            try:
+                self._client.generate(model=model, prompt='', keep_alive=self.keep_alive)
+                self.preloaded[model] = round(time.time() - start_time, 2)
+                print(f"🔥 Loaded Ollama model {model} in {self.preloaded[model]:.2f}s")
+            except Exception as e:
+                self.preloaded[model] = f"failed: {e}"
+                print(f"⚠️ Could not preload Ollama model {model}: {e}")
+
+    def describe(self):
+        with self._lock:
+            models = {model: dict(stats) for model, stats in self._models.items()}
+            in_flight = len(self._in_flight)
+        return {
+            'keep_alive': self.keep_alive,
+            'max_concurrent_per_model': self.max_concurrent,
+            'in_flight': in_flight,
+            'preloaded': dict(self.preloaded),
+            'models': models,
+        }
+
+
+ollama_client = OllamaClient(
+    host=config.OLLAMA_HOST,
+    keep_alive=config.OLLAMA_KEEP_ALIVE,
+    max_concurrent=config.OLLAMA_MAX_CONCURRENT_PER_MODEL,
+)
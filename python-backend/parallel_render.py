@@ -0,0 +1,236 @@
+import ast
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import config
+from manim_renderer import QUALITY_DIRS, record_render
+from preflight import validate_code
+from render_index import render_index
+from video_packaging import get_ffmpeg
+
+
+# Appended to a chunk's code: only section number {chunk} renders, the
+# others still run (so objects end up in the right state) but skip their
+# animations. Patching the class itself keeps warm workers unaffected.
+CHUNK_SUFFIX = '''
+
+def _chunk_setup(self, _original={scene}.setup):
+    _original(self)
+    self._chunk_section = 0
+    self.renderer.file_writer.sections[-1].skip_animations = {chunk} != 0
+
+
+def _chunk_next_section(self, *args, _original={scene}.next_section, **kwargs):
+    self._chunk_section += 1
+    if self._chunk_section != {chunk}:
+        if len(args) >= 3:
+            args = args[:2] + (True,) + args[3:]
+        else:
+            kwargs['skip_animations'] = True
+    return _original(self, *args, **kwargs)
+
+
+{scene}.setup = _chunk_setup
+{scene}.next_section = _chunk_next_section
+'''
+
+
+def count_sections(code, scene_name):
+    """
+    Number of sections `scene_name` splits into at self.next_section() calls.
+
+    Only calls that are plain statements directly in construct() are counted,
+    since the number of sections must be known before rendering; anything
+    else (loops, helpers, conditionals) returns 1 and the scene is not split.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return 1
+    for node in tree.body:
+        if not (isinstance(node, ast.ClassDef) and node.name == scene_name):
+            continue
+        construct = next((item for item in node.body
+                          if isinstance(item, ast.FunctionDef) and item.name == 'construct'), None)
+        if construct is None:
+            return 1
+        direct = 0
+        for statement in construct.body:
+            if (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call)
+                    and isinstance(statement.value.func, ast.Attribute)
+                    and statement.value.func.attr == 'next_section'):
+                direct += 1
+        nested = sum(1 for child in ast.walk(construct)
+                     if isinstance(child, ast.Attribute) and child.attr == 'next_section')
+        return direct + 1 if direct == nested else 1
+    return 1
+
+
+def chunk_code(code, scene_name, index):
+    """Code that renders only section `index` of `scene_name`."""
+    return code + CHUNK_SUFFIX.format(scene=scene_name, chunk=index)
+
+
+def scenes_with_own_construct(code):
+    """
+    Renderable scenes that define construct() in their own class body.
+
+    A subclass that only inherits construct (`class B(A): pass`) would play
+    its parent's animations again, so it isn't a separate piece of the video.
+    """
+    scenes = validate_code(code, allowed_imports=(), blocked_calls=())['scenes']
+    if not scenes:
+        return []
+    own = {node.name for node in ast.parse(code).body
+           if isinstance(node, ast.ClassDef)
+           and any(isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == 'construct'
+                   for item in node.body)}
+    return [scene_name for scene_name in scenes if scene_name in own]
+
+
+def plan_chunks(code, split_sections=True):
+    """(scene name, section index or None) for every piece to render, in playback order."""
+    chunks = []
+    for scene_name in scenes_with_own_construct(code):
+        sections = count_sections(code, scene_name) if split_sections else 1
+        if sections > 1:
+            chunks.extend((scene_name, index) for index in range(sections))
+        else:
+            chunks.append((scene_name, None))
+    return chunks
+
+
+def concat_videos(paths, output_path):
+    """Join MP4s with identical encoding settings without re-encoding (ffmpeg concat demuxer)."""
+    ffmpeg = get_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError('ffmpeg not found')
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as list_file:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    try:
+        result = subprocess.run(
+            [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+             '-i', list_file.name, '-c', 'copy', '-movflags', '+faststart', output_path],
+            capture_output=True,
+            text=True,
+            timeout=config.PACKAGING_TIMEOUT
+        )
+    finally:
+        os.unlink(list_file.name)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+    return output_path
+
+
+def _discard(video_path):
+    """Delete an intermediate chunk video and its index row."""
+    render_index.remove(video_path)
+    try:
+        os.unlink(video_path)
+    except OSError:
+        pass
+    parent = Path(video_path).parent
+    for folder in (parent, parent.parent):
+        try:
+            folder.rmdir()
+        except OSError:
+            break
+
+
+def _render_first_scene(code, render_fn, chunks, reason, output_dir, quality, output_name, log):
+    """
+    Fallback when the pieces can't be rendered and joined: render the first
+    scene whole, and say so in the result when other scenes are missing.
+    """
+    result = render_fn(code, output_dir=output_dir, quality=quality, preview=False,
+                       output_name=output_name, log=log)
+    scene_names = list(dict.fromkeys(scene for scene, _ in chunks))
+    if result.get('success') and len(scene_names) > 1:
+        print(f"⚠️ Rendered only {scene_names[0]} of {len(scene_names)} scenes ({reason})")
+        result['degraded'] = True
+        result['warning'] = (f"Only the first scene ({scene_names[0]}) was rendered; "
+                             f"skipped {', '.join(scene_names[1:])} because {reason}")
+    return result
+
+
+def render_parallel(code, render_fn, output_dir="renders", quality="l", output_name=None,
+                    split_sections=True, max_workers=None, log=None):
+    """
+    Render every scene in `code` (and, with split_sections, every section of
+    each scene) in separate processes at once, then concatenate the pieces
+    losslessly into one video. Same result contract as render_manim_scene.
+
+    `render_fn` renders one piece: it takes the render_manim_scene arguments
+    plus scene_name. Pieces are written to their own module files (which
+    also keeps their partial movie caches apart). Code with a single piece is rendered directly, and if
+    ffmpeg is missing or any piece fails the first scene is rendered on its
+    own as before; the result is then marked `degraded` when scenes were
+    left out. Each piece reports to `log` under its own name.
+    """
+    chunks = plan_chunks(code, split_sections=split_sections)
+    if len(chunks) <= 1:
+        return render_fn(code, output_dir=output_dir, quality=quality, preview=False,
+                         output_name=output_name, log=log)
+    if not get_ffmpeg():
+        return _render_first_scene(code, render_fn, chunks, 'ffmpeg was not found', output_dir=output_dir,
+                                   quality=quality, output_name=output_name, log=log)
+
+    name = output_name or str(int(time.time()))
+    max_workers = max_workers or config.PARALLEL_RENDER_WORKERS
+    print(f"🧩 Rendering {len(chunks)} pieces in parallel ({max_workers} at a time)")
+    start_time = time.time()
+
+    def render_chunk(numbered_chunk):
+        number, (scene_name, section) = numbered_chunk
+        chunk_source = code if section is None else chunk_code(code, scene_name, section)
+        piece = f"part{number:02d}"
+        return render_fn(chunk_source, output_dir=output_dir, quality=quality, preview=False,
+                         output_name=f"{name}_{piece}", scene_name=scene_name,
+                         module_name=f"scene_{piece}", log=log.piece(piece) if log else None)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render-chunk') as executor:
+        results = list(executor.map(render_chunk, enumerate(chunks)))
+
+    videos = [result['video_path'] for result in results if result.get('success')]
+    if len(videos) != len(results):
+        failed = next(result for result in results if not result.get('success'))
+        print(f"⚠️ A parallel piece failed, rendering serially instead: {str(failed.get('error'))[:200]}")
+        for video in videos:
+            _discard(video)
+        return _render_first_scene(code, render_fn, chunks, f"a piece failed: {str(failed.get('error'))[:200]}",
+                                   output_dir=output_dir, quality=quality, output_name=output_name, log=log)
+
+    scene_names = list(dict.fromkeys(scene for scene, _ in chunks))
+    unique_id = f"{scene_names[0]}_{name}"
+    output_path = os.path.join(output_dir, 'videos', f"parallel_{name}",
+                               QUALITY_DIRS.get(quality, quality), f"{unique_id}.mp4")
+    try:
+        concat_videos(videos, output_path)
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f"Could not join rendered pieces: {e}",
+            'video_path': None
+        }
+    finally:
+        for video in videos:
+            _discard(video)
+
+    record_render(output_path, scene_names[0], quality)
+    print(f"✅ Joined {len(videos)} pieces in {time.time() - start_time:.1f}s: {output_path}")
+    return {
+        'success': True,
+        'video_path': output_path,
+        'scene_name': scene_names[0],
+        'scenes': scene_names,
+        'chunks': len(videos),
+        'unique_id': unique_id,
+        'log_path': log.path if log else None
+    }
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import config
+from render_index import render_index
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class PartialMovieCache:
+    """
+    Per-chat-session media directories that keep manim's partial movie files.
+
+    manim hashes every `self.play` call and reuses the matching file from
+    partial_movie_files/ when caching is enabled, so a follow-up edit only
+    re-renders the animations that changed before concatenating. That only
+    works if the same media_dir and module name are used across renders, so
+    each session gets a stable directory here. Renders within a session are
+    serialized, and total size is bounded by evicting the least recently
+    used sessions. Each session's size is measured when a render in it
+    finishes, so budget checks and stats() don't walk the whole tree. Finished videos are moved out to `videos_dir` (publish())
+    so they can be served like any other render.
+    """
+
+    def __init__(self, root, videos_dir, max_bytes, session_max_bytes):
+        self.root = Path(root)
+        self.videos_dir = Path(videos_dir)
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self._locks = {}        # session dir name -> threading.Lock
+        self._last_used = {}    # session dir name -> timestamp
+        self._sizes = None      # session dir name -> bytes on disk, measured after each render
+        self._lock = threading.Lock()
+        self.bytes_evicted = 0
+
+    def _session_name(self, chat_id):
+        # chat ids come from the client, so never use them as paths directly
+        return hashlib.sha1(str(chat_id).encode('utf-8')).hexdigest()[:16]
+
+    @contextmanager
+    def session(self, chat_id):
+        """Hold the session's media directory for the duration of one render."""
+        name = self._session_name(chat_id)
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            session_dir = self.root / name
+            session_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                yield str(session_dir)
+            finally:
+                # Only this session changed, so only its directory is measured
+                size = _dir_size(session_dir)
+                self._session_sizes()
+                with self._lock:
+                    self._last_used[name] = time.time()
+                    self._sizes[name] = size
+        self.enforce_budget()
+
+    def _session_sizes(self):
+        """Copy of the per-session byte counts; the directories are walked once, on first use."""
+        with self._lock:
+            if self._sizes is not None:
+                return dict(self._sizes)
+        sizes = {}
+        if self.root.exists():
+            for session_dir in self.root.iterdir():
+                if session_dir.is_dir():
+                    sizes[session_dir.name] = _dir_size(session_dir)
+        with self._lock:
+            if self._sizes is None:
+                self._sizes = sizes
+            return dict(self._sizes)
+
+    def publish(self, video_path):
+        """
+        Move a video rendered in a session directory under `videos_dir` and
+        return its new path. The partial movie files stay behind for reuse.
+        """
+        try:
+            relative = Path(video_path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return video_path
+        target = self.videos_dir / 'sessions' / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(video_path, target)
+        render_index.move(video_path, target)
+        return str(target)
+
+    def _evict(self, name, reason):
+        session_dir = self.root / name
+        shutil.rmtree(session_dir, ignore_errors=True)
+        with self._lock:
+            self._last_used.pop(name, None)
+            size = self._sizes.pop(name, 0)
+        self.bytes_evicted += size
+        print(f"🗑️ Evicted partial movie cache {name} ({size / 1024 / 1024:.1f} MB, {reason})")
+
+    def enforce_budget(self):
+        """Evict sessions over their own cap, then LRU sessions until under the total cap."""
+        sizes = self._session_sizes()
+
+        for name, size in list(sizes.items()):
+            if size > self.session_max_bytes and not self._in_use(name):
+                self._evict(name, 'session over limit')
+                del sizes[name]
+
+        total = sum(sizes.values())
+        # Sessions we haven't seen since startup sort first (oldest)
+        for name in sorted(sizes, key=lambda n: self._last_used.get(n, 0)):
+            if total <= self.max_bytes:
+                break
+            if self._in_use(name):
+                continue
+            self._evict(name, 'total cache over limit')
+            total -= sizes[name]
+
+    def _in_use(self, name):
+        with self._lock:
+            lock = self._locks.get(name)
+        return lock is not None and lock.locked()
+
+    def stats(self):
+        size = sum(self._session_sizes().values())
+        with self._lock:
+            sessions = len(self._last_used)
+        return {
+            'enabled': config.PARTIAL_CACHE_ENABLED,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'sessions': sessions,
+            'bytes_evicted': self.bytes_evicted,
+        }
+
+
+partial_cache = PartialMovieCache(
+    os.path.join('renders', 'sessions'),
+    os.path.join('renders', 'videos'),
+    max_bytes=config.PARTIAL_CACHE_MAX_MB * 1024 * 1024,
+    session_max_bytes=config.PARTIAL_CACHE_SESSION_MAX_MB * 1024 * 1024,
+)
@@ -1,16 +1,141 @@
-import ollama
 from pinecone import Pinecone
+from pinecone.exceptions import PineconeApiException, PineconeProtocolError
+import urllib3
 import config
 import re
+import threading
+import time
+from semantic_cache import SemanticCache
+from local_index import get_local_index
+from code_patch import apply_patch_response, PatchError
+from chat_sessions import chat_sessions
+from model_router import code_router
+from ollama_client import ollama_client
+from preflight import validate_code
+
+
+# Process-wide Pinecone handles, created on first use and shared by all requests
+_pinecone_client = None
+_pinecone_index = None
+_pinecone_lock = threading.Lock()
+
+# How template edits were produced (see CODE_EDIT_MODE), reported by /health
+edit_stats = {
+    'patch_attempts': 0,
+    'patches_applied': 0,
+    'patch_failures': 0,
+    'full_generations': 0,
+    'patch_tokens': 0,
+    'full_tokens': 0,
+}
+
+
+def describe_edits():
+    """edit_stats plus the share of patches that fell back to a full rewrite."""
+    attempts = edit_stats['patch_attempts']
+    return {
+        'mode': config.CODE_EDIT_MODE,
+        **edit_stats,
+        'patch_fallback_rate': round(edit_stats['patch_failures'] / attempts, 3) if attempts else None,
+    }
+
+
+def get_pinecone_client():
+    """Return the shared Pinecone client, creating it on first use."""
+    global _pinecone_client
+    if _pinecone_client is None:
+        with _pinecone_lock:
+            if _pinecone_client is None:
+                _pinecone_client = Pinecone(
+                    api_key=config.PINECONE_API_KEY,
+                    pool_threads=config.PINECONE_POOL_SIZE
+                )
+    return _pinecone_client
+
+
+def get_pinecone_index():
+    """Return the shared index handle. Its HTTP connection pool keeps connections alive between requests."""
+    global _pinecone_index
+    if _pinecone_index is None:
+        pc = get_pinecone_client()
+        with _pinecone_lock:
+            if _pinecone_index is None:
+                _pinecone_index = pc.Index(
+                    config.PINECONE_INDEX_NAME,
+                    pool_threads=config.PINECONE_POOL_SIZE,
+                    connection_pool_maxsize=config.PINECONE_POOL_SIZE
+                )
+    return _pinecone_index
+
+
+def is_transient(error):
+    """True for errors worth retrying: timeouts, dropped connections, 429 and 5xx responses."""
+    if isinstance(error, PineconeApiException):
+        return error.status in (408, 429) or (error.status or 0) >= 500
+    return isinstance(error, (TimeoutError, ConnectionError, PineconeProtocolError,
+                              urllib3.exceptions.TimeoutError, urllib3.exceptions.ProtocolError,
+                              urllib3.exceptions.MaxRetryError, urllib3.exceptions.NewConnectionError))
+
+
+def with_retries(func, description):
+    """Call func(), retrying transient errors with exponential backoff. Other errors are raised at once."""
+    attempts = config.PINECONE_MAX_RETRIES + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            delay = config.PINECONE_RETRY_BACKOFF * (2 ** (attempt - 1))
+            print(f"⚠️ {description} failed (attempt {attempt}/{attempts}): {e}. Retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def pinecone_embed(pc, model, inputs, parameters=None, timeout=None):
+    """
+    pc.inference.embed with a request timeout (default PINECONE_TIMEOUT).
+    The SDK's embed() doesn't accept _request_timeout, so the same request
+    is sent through the inference API client it wraps.
+    """
+    from pinecone.inference import EmbeddingsList
+    from pinecone.inference.inference_request_builder import InferenceRequestBuilder
+    request = InferenceRequestBuilder.embed_request(model=model, inputs=inputs, parameters=parameters)
+    api = pc.inference._Inference__inference_api
+    response = api.embed(embed_request=request, _request_timeout=timeout or config.PINECONE_TIMEOUT)
+    return EmbeddingsList(response)
+
+
+def warm_up_rag():
+    """Open the Pinecone connections (or load the local index) ahead of the first user request."""
+    start_time = time.time()
+    if config.RAG_BACKEND == 'local':
+        try:
+            get_local_index()
+            embed_query("warm up")
+            print(f"🔥 Local index warmed up in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            print(f"⚠️ Local index warm-up failed: {e}")
+        return
+    try:
+        index = get_pinecone_index()
+        index.describe_index_stats(_request_timeout=config.PINECONE_TIMEOUT)
+        get_embedding_pinecone("warm up", get_pinecone_client())
+        print(f"🔥 Pinecone client warmed up in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        print(f"⚠️ Pinecone warm-up failed: {e}")
 
 
 def get_embedding_pinecone(text, pc):
     """Generate embedding using Pinecone's llama-text-embed-v2."""
     try:
-        embedding = pc.inference.embed(
-            model='llama-text-embed-v2',
-            inputs=[text],
-            parameters={"input_type": "query"}
+        embedding = with_retries(
+            lambda: pinecone_embed(
+                pc,
+                model='llama-text-embed-v2',
+                inputs=[text],
+                parameters={"input_type": "query"}
+            ),
+            "Pinecone embed"
         )
         return embedding[0]['values']
     except Exception as e:
@@ -18,32 +143,82 @@ def get_embedding_pinecone(text, pc):
         return None
 
 
-def search_rag(query, top_k=1):
+def get_embedding_ollama(text, model=None):
+    """Generate embedding locally with Ollama (no network round trip to Pinecone)."""
+    try:
+        response = ollama_client.embeddings(model=model or config.OLLAMA_EMBEDDING_MODEL, prompt=text)
+        return response['embedding']
+    except Exception as e:
+        print(f"Error generating embedding: {e}")
+        return None
+
+
+def embed_query(text):
+    """Embed a query the same way the active RAG backend's vectors were embedded."""
+    if config.RAG_BACKEND == 'local':
+        embedding = get_local_index().embedding
+        if embedding['provider'] == 'ollama':
+            return get_embedding_ollama(text, model=embedding['model'])
+    return get_embedding_pinecone(text, get_pinecone_client())
+
+
+def fetch_documents(ids):
+    """Metadata of the given vector ids from the configured RAG backend."""
+    ids = list(ids)
+    if config.RAG_BACKEND == 'local':
+        return get_local_index().fetch_metadata(ids)
+    index = get_pinecone_index()
+    response = with_retries(
+        lambda: index.fetch(ids=ids, _request_timeout=config.PINECONE_TIMEOUT),
+        "Pinecone fetch"
+    )
+    return {vector_id: dict(vector.metadata or {}) for vector_id, vector in response.vectors.items()}
+
+
+def search_rag(query, top_k=1, query_embedding=None):
     """Search the RAG database for relevant Manim documentation."""
     print(f"\n🔍 Searching RAG for relevant documentation...")
     
-    # Initialize Pinecone
-    pc = Pinecone(api_key=config.PINECONE_API_KEY)
-    index = pc.Index(config.PINECONE_INDEX_NAME)
-    
-    # Generate embedding for the query using Pinecone
-    query_embedding = get_embedding_pinecone(query, pc)
+    # Generate embedding for the query (unless the caller already has one)
+    if query_embedding is None:
+        query_embedding = embed_query(query)
     
     if query_embedding is None:
         print("Failed to generate query embedding!")
         return []
     
-    # Search in Pinecone
-    results = index.query(
-        vector=query_embedding,
-        top_k=top_k,
-        include_metadata=True
-    )
+    if config.RAG_BACKEND == 'local':
+        # In-process search over the memory-mapped local index
+        results = get_local_index().query(
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True
+        )
+    else:
+        # Search in Pinecone, reusing the process-wide index handle
+        index = get_pinecone_index()
+        results = with_retries(
+            lambda: index.query(
+                vector=query_embedding,
+                top_k=top_k,
+                include_metadata=True,
+                _request_timeout=config.PINECONE_TIMEOUT
+            ),
+            "Pinecone query"
+        )
+    
+    # Matches on a document's later chunks carry only its doc_id; the full
+    # record is stored once, on the document's first chunk
+    missing = {match['metadata'].get('doc_id') for match in results['matches']
+               if 'response' not in match['metadata']} - {None}
+    documents = fetch_documents(missing) if missing else {}
     
     # Extract relevant documentation
     docs = []
     for match in results['matches']:
         metadata = match['metadata']
+        if 'response' not in metadata:
+            metadata = {**metadata, **documents.get(metadata.get('doc_id'), {})}
         docs.append({
             'filename': metadata.get('filename', 'Unknown'),
             'instruction': metadata.get('instruction', ''),
@@ -73,10 +248,8 @@ def extract_code_from_response(text):
     return text
 
 
-def modify_code_with_rag(user_request, rag_template):
-    """Modify the RAG template code according to user's request using deepseek-r1:8b."""
-    print(f"🔧 Modifying template code with deepseek-r1:8b...")
-
+def build_modify_prompts(user_request, rag_template):
+    """Build the (system, user) prompts asking the LLM to edit the RAG template."""
     system_prompt = """You are a Manim expert code modifier. Your task is to take an existing Manim code template and modify ONLY the requested function/animation to match the user's request.
 
 STRICT RULES:
@@ -103,13 +276,125 @@ Preserve all comments, blank lines, and formatting exactly as in the original co
 Return only the complete modified Python code without any omissions or simplifications.
 """
 
+    return system_prompt, user_prompt
+
+
+def build_patch_prompts(user_request, rag_template):
+    """Build the (system, user) prompts asking the LLM for search/replace edits to the RAG template."""
+    system_prompt = """You are a Manim expert code modifier. Your task is to take an existing Manim code template and change it to match the user's request by writing edits, not by rewriting the code.
+
+Write each edit as a search/replace block:
+<<<<<<< SEARCH
+lines copied exactly from the template
+=======
+the lines that replace them
+>>>>>>> REPLACE
+
+STRICT RULES:
+1. Copy the SEARCH lines exactly from the template, including indentation, comments and blank lines.
+2. Each SEARCH must match exactly one place in the template; include a neighbouring line if needed to make it unique.
+3. Keep each block small and use several blocks for changes in different places.
+4. To add lines, SEARCH for the line before them and repeat it in REPLACE followed by the new lines.
+5. Change only what the user requested; everything outside the blocks is kept as it is.
+6. Return only the edit blocks, no explanations and no complete code.
+"""
+
+    user_prompt = f"""ORIGINAL TEMPLATE CODE:
+{rag_template}
+
+USER REQUEST:
+{user_request}
+
+INSTRUCTIONS:
+Write the search/replace blocks that modify the above template according to the user's request.
+Return only the edit blocks.
+"""
+
+    return system_prompt, user_prompt
+
+
+def _context_for(session_state, model):
+    """The chat's Ollama context if it came from `model` (contexts don't carry across models)."""
+    if session_state and session_state.get('context_model') == model:
+        return session_state.get('context')
+    return None
+
+
+def _remember_context(session_state, model, context):
+    if session_state is not None:
+        session_state['context'] = context
+        session_state['context_model'] = model
+
+
+def modify_code_with_patch(user_request, rag_template, session_state=None, model=None):
+    """
+    Ask the model for search/replace edits instead of the whole file, so
+    generation time follows the size of the change rather than the template.
+    Returns the patched code, or None if the edits don't apply or break the code.
+    `session_state` and `model` work as in modify_code_with_rag.
+    """
+    model = model or code_router.largest
+    print(f"🔧 Patching template code with {model}...")
+
+    system_prompt, user_prompt = build_patch_prompts(user_request, rag_template)
+    edit_stats['patch_attempts'] += 1
+
+    try:
+        response = ollama_client.generate(
+            model=model,
+            system=system_prompt,
+            prompt=user_prompt,
+            context=_context_for(session_state, model)
+        )
+        edit_stats['patch_tokens'] += response.get('eval_count') or 0
+        patched_code = apply_patch_response(rag_template, response['response'])
+    except PatchError as e:
+        print(f"⚠️ Patch did not apply ({e}), regenerating the full code")
+        edit_stats['patch_failures'] += 1
+        return None
+    except Exception as e:
+        print(f"❌ Error generating patch: {e}")
+        edit_stats['patch_failures'] += 1
+        return None
+
+    # A failed patch isn't kept in the conversation the full regeneration continues
+    _remember_context(session_state, model, response.get('context'))
+    edit_stats['patches_applied'] += 1
+    print(f"✓ Patch applied ({len(patched_code)} characters)\n")
+    return patched_code
+
+
+def modify_code_with_rag(user_request, rag_template, session_state=None, model=None):
+    """
+    Modify the RAG template code according to user's request.
+
+    `model` defaults to the largest tier of CODE_MODEL_TIERS. With
+    CODE_EDIT_MODE=patch the model only writes edits; the full file is
+    regenerated when they can't be applied. If `session_state` is a dict, its
+    'context' (Ollama context tokens from the chat's previous turn) continues
+    that conversation and is replaced with the context after this turn.
+    """
+    model = model or code_router.largest
+    if config.CODE_EDIT_MODE == 'patch':
+        patched_code = modify_code_with_patch(user_request, rag_template, session_state=session_state, model=model)
+        if patched_code:
+            return patched_code
+
+    print(f"🔧 Modifying template code with {model}...")
+
+    system_prompt, user_prompt = build_modify_prompts(user_request, rag_template)
+
     try:
-        print(f"Calling ollama.generate() with model 'gpt-oss:20b'...")
-        response = ollama.generate(
-            model='gpt-oss:20b',
+        print(f"Calling ollama_client.generate() with model '{model}'...")
+        response = ollama_client.generate(
+            model=model,
             system=system_prompt,
-            prompt=user_prompt
+            prompt=user_prompt,
+            context=_context_for(session_state, model)
         )
+        _remember_context(session_state, model, response.get('context'))
+        edit_stats['full_generations'] += 1
+        edit_stats['full_tokens'] += response.get('eval_count') or 0
 
         modified_code = response['response']
         print(f"✓ Code modified successfully ({len(modified_code)} characters)\n")
@@ -121,11 +406,107 @@ Return only the complete modified Python code without any omissions or simplific
         import traceback
         traceback.print_exc()
         return None
+
+
+def code_problem(code):
+    """Why generated code can't be rendered (first preflight error), or None if it can."""
+    if not code:
+        return 'no code was generated'
+    report = validate_code(code)
+    if report['valid']:
+        return None
+    error = report['errors'][0]
+    return f"{error['message']} (line {error['line']})"
+
+
+def modify_code_cascade(user_request, rag_template, retrieval_score=None, session_state=None):
+    """
+    modify_code_with_rag up the model tiers: start on the tier code_router
+    picks and move to the next one while the code fails validation.
+
+    Returns the extracted code (the largest tier's answer even if it is
+    invalid, so preflight reports it) or None if every tier failed to answer.
+    The model that produced it is stored in session_state['model'].
+    """
+    models = code_router.plan(retrieval_score, user_request, rag_template)
+    code = None
+    for position, model in enumerate(models):
+        start_time = time.time()
+        response = modify_code_with_rag(user_request, rag_template, session_state=session_state, model=model)
+        code = extract_code_from_response(response) if response else None
+        problem = code_problem(code)
+        code_router.record(model, time.time() - start_time, problem is None)
+        if session_state is not None and code:
+            session_state['model'] = model
+        if problem is None or position == len(models) - 1:
+            return code
+        code_router.escalate(model, models[position + 1], problem)
+    return code
+
+
+def modify_code_with_rag_stream(user_request, rag_template, stats=None, patch=False, session_state=None,
+                                model=None):
+    """
+    Streaming variant of modify_code_with_rag: yields response text as the
+    model produces it. If `stats` is a dict it is filled with time to first
+    token, token count and tokens/sec once generation finishes. With `patch`
+    the model writes search/replace edits instead of the full code.
+    `session_state` and `model` work as in modify_code_with_rag.
+    """
+    model = model or code_router.largest
+    print(f"🔧 Streaming template {'patch' if patch else 'modification'} with {model}...")
+
+    build_prompts = build_patch_prompts if patch else build_modify_prompts
+    system_prompt, user_prompt = build_prompts(user_request, rag_template)
+
+    start_time = time.time()
+    first_token_time = None
+    chunks = 0
+    final = {}
+    for chunk in ollama_client.generate(
+        model=model,
+        system=system_prompt,
+        prompt=user_prompt,
+        context=_context_for(session_state, model),
+        stream=True
+    ):
+        text = chunk.get('response', '')
+        if text:
+            if first_token_time is None:
+                first_token_time = time.time()
+            chunks += 1
+            yield text
+        if chunk.get('done'):
+            final = chunk
+
+    _remember_context(session_state, model, final.get('context'))
+
+    if stats is not None:
+        elapsed = time.time() - start_time
+        # Ollama reports exact token counts and decode time in the final chunk
+        tokens = final.get('eval_count') or chunks
+        edit_stats['patch_tokens' if patch else 'full_tokens'] += tokens
+        eval_seconds = (final.get('eval_duration') or 0) / 1e9
+        if not eval_seconds and first_token_time:
+            eval_seconds = time.time() - first_token_time
+        stats.update({
+            'time_to_first_token': round(first_token_time - start_time, 3) if first_token_time else None,
+            'generation_time': round(elapsed, 3),
+            'tokens': tokens,
+            'tokens_per_sec': round(tokens / eval_seconds, 2) if eval_seconds else None,
+        })
     
 
     
-def manim_pipeline(user_prompt):
-    """Complete pipeline: RAG Search -> Get Template -> Modify with LLM."""
+def run_manim_pipeline(user_prompt, query_embedding=None, session_state=None):
+    """
+    Complete pipeline: RAG Search -> Get Template -> Modify with LLM.
+    
+    Returns (code, modified): `modified` is False when the LLM step failed and
+    the unmodified template is returned instead. If `session_state` is a dict
+    it receives the chosen 'template', its 'template_file', the 'model' that
+    wrote the code and its 'context'.
+    """
     print("="*80)
     print("RAG-FIRST MANIM CODE GENERATION PIPELINE")
     print("="*80)
@@ -136,21 +517,24 @@ def manim_pipeline(user_prompt):
     print("-"*80)
     
     try:
-        rag_docs = search_rag(user_prompt, top_k=1)
+        rag_docs = search_rag(user_prompt, top_k=1, query_embedding=query_embedding)
     except Exception as e:
         print(f"❌ Error in RAG search: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        return None, False
     
     if not rag_docs:
         print("❌ No RAG documentation found!")
-        return None
+        return None, False
     
     # Get the top result
     top_result = rag_docs[0]
     template_code = top_result['response']  # Get the response (Manim code) from metadata
     matched_instruction = top_result['instruction']  # The instruction that was matched
+    if session_state is not None:
+        session_state['template'] = template_code
+        session_state['template_file'] = top_result['filename']
     
     print(f"✓ Best Match Found:")
     print(f"  File: {top_result['filename']}")
@@ -161,25 +545,23 @@ def manim_pipeline(user_prompt):
     print(template_code[:500] + "..." if len(template_code) > 500 else template_code)
     print("-"*40 + "\n")
     
-    # Step 2: Modify the template code using gpt-oss:20b
+    # Step 2: Modify the template code (smallest suitable model first)
     print("STEP 2: Modify Template with LLM")
     print("-"*80)
     
     try:
-        modified_code = modify_code_with_rag(user_prompt, template_code)
+        final_code = modify_code_cascade(user_prompt, template_code, retrieval_score=top_result['score'],
+                                         session_state=session_state)
     except Exception as e:
         print(f"❌ Error in code modification: {e}")
         import traceback
         traceback.print_exc()
         print("⚠️ Falling back to original template")
-        return template_code
+        return template_code, False
     
-    if not modified_code:
+    if not final_code:
         print("⚠️ Failed to modify code, returning original template")
-        return template_code
-    
-    # Extract clean code
-    final_code = extract_code_from_response(modified_code)
+        return template_code, False
     
     print("="*80)
     print("✅ FINAL MODIFIED CODE:")
@@ -187,13 +569,254 @@ def manim_pipeline(user_prompt):
     print(final_code)
     print("="*80)
     
-    return final_code
+    return final_code, True
 
 
-def explain_manim_code(manim_code, user_request):
-    """Use deepseek-r1:1.5b to solve the user's request through text explanation."""
-    print(f"\n📚 Generating text explanation with deepseek-r1:1.5b...")
+def chat_session_for(chat_id, follow_up=False):
+    """The chat's session if this message should edit its current code, else None."""
+    if not (config.CHAT_SESSIONS_ENABLED and follow_up):
+        return None
+    session = chat_sessions.get(chat_id)
+    return session if session and session.code else None
+
+
+def continue_chat(user_prompt, session):
+    """
+    Follow-up turn: edit the chat's current code directly, skipping the
+    semantic cache and retrieval, and continuing the model's context.
+
+    Returns (code, modified, model) where modified is as in run_manim_pipeline;
+    the current code comes back unchanged if the LLM step fails.
+    """
+    print(f"💬 Follow-up in chat {session.chat_id} (turn {session.turns + 1}), editing its current code")
+    chat_sessions.stats['follow_ups'] += 1
+    session_state = {'context': session.context, 'context_model': session.context_model}
+    code = modify_code_cascade(user_prompt, session.code, session_state=session_state)
+    if not code:
+        print("⚠️ Failed to modify code, returning the chat's current code")
+        return session.code, False, None
+    chat_sessions.update(session.chat_id, code=code, context=session_state.get('context'),
+                         context_model=session_state.get('context_model'))
+    return code, True, session_state.get('model')
+
+
+def generate_manim_code(user_prompt, use_cache=True, chat_id=None, follow_up=False):
+    """
+    Run the pipeline behind the semantic response cache.
     
+    Returns a dict with the generated `code` (None on failure), whether it was
+    `cached`, and for cache hits the `similarity` to and text of the matched prompt.
+    
+    With follow_up=True and a `chat_id` that already has code (see
+    chat_sessions.py) the message edits that code instead (`follow_up` in the
+    result). Otherwise it starts from retrieval.
+    """
+    session = chat_session_for(chat_id, follow_up)
+    if session:
+        code, _, model = continue_chat(user_prompt, session)
+        return {'code': code, 'cached': False, 'follow_up': True, 'model': model}
+    
+    query_embedding = None
+    if use_cache and config.SEMANTIC_CACHE_ENABLED:
+        try:
+            hit, query_embedding = response_cache.lookup(user_prompt)
+        except Exception as e:
+            print(f"⚠️ Semantic cache lookup failed: {e}")
+            hit = None
+        if hit:
+            print(f"⚡ Semantic cache hit (similarity {hit['similarity']:.3f}): {hit['prompt']}")
+            chat_sessions.update(chat_id, code=hit['code'])
+            return {
+                'code': hit['code'],
+                'cached': True,
+                'similarity': round(hit['similarity'], 4),
+                'matched_prompt': hit['prompt'],
+                'follow_up': False
+            }
+    
+    session_state = {}
+    code, modified = run_manim_pipeline(user_prompt, query_embedding=query_embedding,
+                                        session_state=session_state)
+    
+    # Only cache real answers: not the template fallback after an LLM failure,
+    # nor the largest tier's code when every tier failed validation
+    if code and modified and use_cache and config.SEMANTIC_CACHE_ENABLED and code_problem(code) is None:
+        try:
+            response_cache.store(user_prompt, code, embedding=query_embedding)
+        except Exception as e:
+            print(f"⚠️ Could not cache generated code: {e}")
+    
+    if code:
+        chat_sessions.update(chat_id, code=code, template=session_state.get('template'),
+                             template_file=session_state.get('template_file'),
+                             context=session_state.get('context'),
+                             context_model=session_state.get('context_model'))
+    
+    return {'code': code, 'cached': False, 'follow_up': False, 'model': session_state.get('model')}
+
+
+def stream_manim_pipeline(user_prompt, chat_id=None, follow_up=False):
+    """
+    Streaming version of generate_manim_code for Server-Sent Events.
+    
+    Yields (event, data) pairs: 'retrieval' once the template is found,
+    'token' for each piece of generated text, then a closing 'done' with the
+    code from extract_code_from_response and generation stats (or 'error').
+    In patch mode the tokens are search/replace edits; if they don't apply a
+    'fallback' event is sent and the full code streams after it. When a
+    smaller model's code fails validation an 'escalate' event names the next
+    model, whose tokens follow. Follow-ups (follow_up=True in a chat with
+    code) skip the cache and retrieval ('retrieval' then has follow_up set
+    and names the chat's template).
+    """
+    start_time = time.time()
+    session = chat_session_for(chat_id, follow_up)
+    session_state = {'context': session.context, 'context_model': session.context_model} if session else {}
+    query_embedding = None
+    retrieval_score = None
+    
+    if session:
+        print(f"💬 Follow-up in chat {chat_id} (turn {session.turns + 1}), editing its current code")
+        chat_sessions.stats['follow_ups'] += 1
+        template_code = session.code
+        yield 'retrieval', {
+            'filename': session.template_file,
+            'score': None,
+            'follow_up': True,
+            'retrieval_time': round(time.time() - start_time, 3)
+        }
+    else:
+        if config.SEMANTIC_CACHE_ENABLED:
+            try:
+                hit, query_embedding = response_cache.lookup(user_prompt)
+            except Exception as e:
+                print(f"⚠️ Semantic cache lookup failed: {e}")
+                hit = None
+            if hit:
+                chat_sessions.update(chat_id, code=hit['code'])
+                yield 'done', {
+                    'code': hit['code'],
+                    'cached': True,
+                    'cache_similarity': round(hit['similarity'], 4),
+                    'follow_up': False,
+                    'execution_time': round(time.time() - start_time, 2)
+                }
+                return
+        
+        try:
+            rag_docs = search_rag(user_prompt, top_k=1, query_embedding=query_embedding)
+        except Exception as e:
+            yield 'error', {'error': f"RAG search failed: {e}"}
+            return
+        if not rag_docs:
+            yield 'error', {'error': 'No RAG documentation found'}
+            return
+        
+        top_result = rag_docs[0]
+        template_code = top_result['response']
+        retrieval_score = top_result['score']
+        session_state['template'] = template_code
+        session_state['template_file'] = top_result['filename']
+        yield 'retrieval', {
+            'filename': top_result['filename'],
+            'score': top_result['score'],
+            'follow_up': False,
+            'retrieval_time': round(time.time() - start_time, 3)
+        }
+    
+    def finish(code, edit_mode, stats, modified=True):
+        # Same guard as the blocking path: only real answers are cached, not the
+        # template fallback after an LLM failure. Follow-ups depend on the
+        # chat's code, so they never go in the shared cache, and code that
+        # failed validation would be served to every similar prompt.
+        if (config.SEMANTIC_CACHE_ENABLED and code and modified and not session
+                and code_problem(code) is None):
+            try:
+                response_cache.store(user_prompt, code, embedding=query_embedding)
+            except Exception as e:
+                print(f"⚠️ Could not cache generated code: {e}")
+        if code:
+            chat_sessions.update(chat_id, code=code, template=session_state.get('template'),
+                                 template_file=session_state.get('template_file'),
+                                 context=session_state.get('context'),
+                                 context_model=session_state.get('context_model'))
+        return {
+            'code': code,
+            'cached': False,
+            'edit_mode': edit_mode,
+            'follow_up': bool(session),
+            'model': session_state.get('model'),
+            'execution_time': round(time.time() - start_time, 2),
+            **stats
+        }
+    
+    def generate_with(model, stats):
+        """Stream one model's attempt. Returns (code, edit mode) via StopIteration."""
+        if config.CODE_EDIT_MODE == 'patch':
+            # Stream the edits, then apply them; regenerate in full if they don't apply
+            edit_stats['patch_attempts'] += 1
+            context = (session_state.get('context'), session_state.get('context_model'))
+            pieces = []
+            try:
+                for text in modify_code_with_rag_stream(user_prompt, template_code, stats=stats, patch=True,
+                                                        session_state=session_state, model=model):
+                    pieces.append(text)
+                    yield 'token', {'text': text, 'mode': 'patch', 'model': model}
+                patched_code = apply_patch_response(template_code, ''.join(pieces))
+            except Exception as e:
+                print(f"⚠️ Patch did not apply ({e}), regenerating the full code")
+                edit_stats['patch_failures'] += 1
+                yield 'fallback', {'reason': str(e), 'model': model}
+                stats.clear()
+                session_state['context'], session_state['context_model'] = context
+            else:
+                edit_stats['patches_applied'] += 1
+                return patched_code, 'patch'
+        
+        pieces = []
+        for text in modify_code_with_rag_stream(user_prompt, template_code, stats=stats,
+                                                session_state=session_state, model=model):
+            pieces.append(text)
+            yield 'token', {'text': text, 'model': model}
+        edit_stats['full_generations'] += 1
+        return extract_code_from_response(''.join(pieces)), 'full'
+    
+    # Smallest suitable model first; move up a tier while the code fails validation
+    models = code_router.plan(retrieval_score, user_prompt, template_code)
+    for position, model in enumerate(models):
+        stats = {}
+        attempt_start = time.time()
+        try:
+            code, edit_mode = yield from generate_with(model, stats)
+            problem = code_problem(code)
+        except Exception as e:
+            print(f"❌ Error streaming code modification: {e}")
+            code, problem = None, str(e)
+        code_router.record(model, time.time() - attempt_start, problem is None)
+        last = position == len(models) - 1
+        if code and (problem is None or last):
+            session_state['model'] = model
+            yield 'done', finish(code, edit_mode, stats)
+            return
+        if not last:
+            code_router.escalate(model, models[position + 1], problem)
+            yield 'escalate', {'from': model, 'to': models[position + 1], 'reason': problem}
+    
+    # Same fallback as the blocking pipeline: hand back the template
+    yield 'done', {
+        **finish(template_code, None, {}, modified=False),
+        'fallback': True,
+        'error': problem
+    }
+
+
+def manim_pipeline(user_prompt):
+    """Complete pipeline: RAG Search -> Get Template -> Modify with LLM."""
+    return generate_manim_code(user_prompt)['code']
+
+
+def build_explanation_messages(user_request):
+    """Chat messages asking EXPLANATION_MODEL to solve the user's request in text."""
     system_message = """You are a mathematics expert and educator. Your task is to solve mathematical problems step-by-step with clear explanations.
 
 Provide:
@@ -210,15 +833,37 @@ Be thorough, educational, and use clear mathematical language."""
 
 Provide a complete solution with explanations for each step."""
 
+    return [
+        {'role': 'system', 'content': system_message},
+        {'role': 'user', 'content': user_message}
+    ]
+
+
+def stream_explanation(user_request):
+    """
+    Yield the explanation of the user's request piece by piece as
+    EXPLANATION_MODEL writes it. Errors from Ollama are raised to the caller.
+    """
+    model = config.EXPLANATION_MODEL
+    print(f"\n📚 Streaming text explanation with {model}...")
+    for chunk in ollama_client.chat(model=model, messages=build_explanation_messages(user_request), stream=True):
+        text = chunk.get('message', {}).get('content', '')
+        if text:
+            yield text
+
+
+def explain_manim_code(manim_code, user_request):
+    """
+    Use EXPLANATION_MODEL (deepseek-r1:1.5b by default) to solve the user's
+    request through text explanation. Only the request matters; manim_code is
+    accepted for compatibility and ignored.
+    """
+    model = config.EXPLANATION_MODEL
+    print(f"\n📚 Generating text explanation with {model}...")
+
     try:
-        print(f"Calling ollama.chat() with model 'deepseek-r1:1.5b'...")
-        response = ollama.chat(
-            model='deepseek-r1:1.5b',
-            messages=[
-                {'role': 'system', 'content': system_message},
-                {'role': 'user', 'content': user_message}
-            ]
-        )
+        print(f"Calling ollama_client.chat() with model '{model}'...")
+        response = ollama_client.chat(model=model, messages=build_explanation_messages(user_request))
         
         explanation = response['message']['content']
         print(f"✓ Explanation generated successfully ({len(explanation)} characters)\n")
@@ -232,6 +877,15 @@ Provide a complete solution with explanations for each step."""
         return f"Unable to generate explanation. Error: {str(e)}"
 
 
+response_cache = SemanticCache(
+    config.SEMANTIC_CACHE_PATH,
+    embed_fn=embed_query,
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    ttl=config.SEMANTIC_CACHE_TTL,
+    max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+)
+
+
 def save_code_to_file(code, filename="generated_manim_scene.py"):
     """Save the generated code to a file in a separate directory to avoid Flask reload."""
     import os
@@ -0,0 +1,156 @@
+import ast
+
+import config
+
+
+# Scene base classes exported by manim
+MANIM_SCENE_CLASSES = {
+    'Scene',
+    'ThreeDScene',
+    'SpecialThreeDScene',
+    'MovingCameraScene',
+    'ZoomedScene',
+    'VectorScene',
+    'LinearTransformationScene',
+}
+
+
+class PreflightError(Exception):
+    """Raised when code fails validation before it reaches the render pool."""
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(report['errors'][0]['message'] if report['errors'] else 'Invalid code')
+
+
+def _error(kind, message, node=None, line=None, col=None):
+    return {
+        'type': kind,
+        'message': message,
+        'line': getattr(node, 'lineno', line),
+        'col': getattr(node, 'col_offset', col),
+    }
+
+
+def _base_name(node):
+    """'Scene' for `Scene`, `manim.Scene` or `m.Scene`; None for anything else."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _check_imports(tree, allowed):
+    errors = []
+    aliases = {}  # local name -> manim name, from `from manim import Scene as S`
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                errors.append(_error('disallowed_import', 'Relative imports are not allowed', node))
+                continue
+            modules = [node.module or '']
+            if node.module and node.module.split('.')[0] == 'manim':
+                for alias in node.names:
+                    if alias.asname:
+                        aliases[alias.asname] = alias.name
+        else:
+            continue
+        for module in modules:
+            if module.split('.')[0] not in allowed:
+                errors.append(_error('disallowed_import', f"Import of '{module}' is not allowed", node))
+    return errors, aliases
+
+
+def _check_calls(tree, blocked):
+    errors = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in blocked:
+            errors.append(_error('disallowed_call', f"Call to '{node.func.id}' is not allowed", node))
+    return errors
+
+
+def find_scenes(tree, aliases=None):
+    """
+    Scene subclasses defined at module level, in definition order.
+
+    A class is a scene if one of its bases is a manim scene class or another
+    scene defined in the file, so indirect inheritance is followed. Returns
+    a list of {'name', 'line', 'has_construct'}, where has_construct also
+    counts a construct inherited from a scene in the file.
+    """
+    aliases = aliases or {}
+    classes = [node for node in tree.body if isinstance(node, ast.ClassDef)]
+    scenes = {}
+    for node in classes:
+        own_construct = any(
+            isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == 'construct'
+            for item in node.body
+        )
+        inherited_construct = False
+        is_scene = False
+        for base in node.bases:
+            name = _base_name(base)
+            name = aliases.get(name, name)
+            if name in scenes:
+                is_scene = True
+                inherited_construct = inherited_construct or scenes[name]['has_construct']
+            elif name in MANIM_SCENE_CLASSES:
+                is_scene = True
+        if is_scene:
+            scenes[node.name] = {
+                'name': node.name,
+                'line': node.lineno,
+                'has_construct': own_construct or inherited_construct,
+            }
+    return list(scenes.values())
+
+
+def validate_code(code, allowed_imports=None, blocked_calls=None):
+    """
+    Check LLM-generated Manim code without importing or running it.
+
+    Returns {'valid', 'scenes', 'errors'}: `scenes` lists the names of the
+    renderable Scene subclasses (defining or inheriting construct), and each
+    error is {'type', 'message', 'line', 'col'} with type one of
+    syntax_error, disallowed_import, disallowed_call, no_scene or
+    missing_construct.
+    """
+    allowed = set(allowed_imports if allowed_imports is not None else config.PREFLIGHT_ALLOWED_IMPORTS)
+    blocked = set(blocked_calls if blocked_calls is not None else config.PREFLIGHT_BLOCKED_CALLS)
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return {
+            'valid': False,
+            'scenes': [],
+            'errors': [_error('syntax_error', f"{e.msg}", line=e.lineno, col=e.offset)],
+        }
+
+    errors, aliases = _check_imports(tree, allowed)
+    errors.extend(_check_calls(tree, blocked))
+
+    scenes = find_scenes(tree, aliases)
+    renderable = [scene['name'] for scene in scenes if scene['has_construct']]
+    if not scenes:
+        errors.append(_error('no_scene', 'No Scene subclass found in the code', line=1, col=0))
+    elif not renderable:
+        errors.append(_error('missing_construct', 'No Scene subclass defines construct()',
+                             line=scenes[0]['line'], col=0))
+
+    return {
+        'valid': not errors,
+        'scenes': renderable,
+        'errors': errors,
+    }
+
+
+def check_code(code):
+    """Validate code for rendering. Returns the report or raises PreflightError."""
+    report = validate_code(code)
+    if not report['valid']:
+        raise PreflightError(report)
+    return report
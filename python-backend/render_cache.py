@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import config
+from render_index import render_index
+from video_packaging import package_hls, remove_packages
+
+
+# Quality flags from fastest to best
+QUALITY_ORDER = ['l', 'm', 'h', 'p', 'k']
+
+
+def quality_rank(quality):
+    """Position of a quality flag in QUALITY_ORDER (unknown flags sort last)."""
+    return QUALITY_ORDER.index(quality) if quality in QUALITY_ORDER else len(QUALITY_ORDER)
+
+
+@lru_cache(maxsize=1)
+def get_manim_version():
+    """Installed manim version, part of the cache key so upgrades invalidate renders."""
+    try:
+        from importlib.metadata import version
+        return version('manim')
+    except Exception:
+        return 'unknown'
+
+
+def normalize_code(code):
+    """Normalize line endings and trailing whitespace so cosmetic diffs share a cache entry."""
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def render_key(code, quality='l'):
+    """Content hash identifying a render of `code` at `quality`."""
+    digest = hashlib.sha256()
+    digest.update(normalize_code(code).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(quality.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(get_manim_version().encode('utf-8'))
+    return digest.hexdigest()
+
+
+def content_key(code):
+    """Hash of the code alone, shared by the renders of every quality tier."""
+    digest = hashlib.sha256()
+    digest.update(normalize_code(code).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(get_manim_version().encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered MP4s.
+
+    Videos live at <cache_dir>/<key>.mp4 with a <key>.json sidecar holding the
+    scene name and access times. Concurrent renders of the same key are
+    collapsed into one (single-flight): later callers wait for the first.
+    Renders of the same code at different qualities form a ladder, indexed by
+    content_key, so any tier that has been rendered can be served directly.
+    """
+
+    def __init__(self, cache_dir, max_entries=100):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._entries = {}    # key -> metadata dict
+        self._ladders = {}    # content key -> {quality: key}
+        self._inflight = {}   # key -> {'event', 'result'} for renders in progress
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self._load()
+
+    def _load(self):
+        """Rebuild the in-memory index from sidecar files left by earlier runs."""
+        if not self.cache_dir.exists():
+            return
+        for meta_file in self.cache_dir.glob('*.json'):
+            try:
+                with open(meta_file, encoding='utf-8') as f:
+                    meta = json.load(f)
+                if (self.cache_dir / f"{meta_file.stem}.mp4").exists():
+                    self._entries[meta_file.stem] = meta
+                    self._add_to_ladder(meta_file.stem, meta)
+            except (OSError, ValueError):
+                continue
+        if self._entries:
+            print(f"📦 Loaded {len(self._entries)} cached renders from {self.cache_dir}")
+
+    def _add_to_ladder(self, key, meta):
+        if meta.get('content_key') and meta.get('quality'):
+            self._ladders.setdefault(meta['content_key'], {})[meta['quality']] = key
+
+    def _remove_from_ladder(self, key, meta):
+        tiers = self._ladders.get(meta.get('content_key'))
+        if tiers and tiers.get(meta.get('quality')) == key:
+            del tiers[meta['quality']]
+            if not tiers:
+                del self._ladders[meta['content_key']]
+
+    def ladder(self, content_key):
+        """Cached renders of one piece of code, as {quality: result} from lowest to highest."""
+        with self._lock:
+            tiers = dict(self._ladders.get(content_key, {}))
+            found = {}
+            for quality in sorted(tiers, key=quality_rank):
+                key = tiers[quality]
+                meta = self._entries.get(key)
+                if meta and self.video_path(key).exists():
+                    found[quality] = self._result(key, meta)
+        return found
+
+    def video_path(self, key):
+        return self.cache_dir / f"{key}.mp4"
+
+    def _result(self, key, meta):
+        return {
+            'success': True,
+            'video_path': str(self.video_path(key)),
+            'scene_name': meta['scene_name'],
+            'unique_id': key,
+            'cache_key': key,
+            'quality': meta.get('quality'),
+            'cached': True,
+        }
+
+    def _write_meta(self, key, meta):
+        with open(self.cache_dir / f"{key}.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def lookup(self, key):
+        """Return a render result for `key` if it is cached, otherwise None."""
+        with self._lock:
+            meta = self._entries.get(key)
+            if meta and not self.video_path(key).exists():
+                # Deleted from disk behind our back
+                self._remove_from_ladder(key, self._entries.pop(key))
+                render_index.remove(self.video_path(key))
+                meta = None
+            if not meta:
+                return None
+            meta['last_access'] = time.time()
+            self.hits += 1
+            try:
+                self._write_meta(key, meta)
+            except OSError:
+                pass
+        return self._result(key, meta)
+
+    def store(self, key, result, content_key=None, quality=None):
+        """Move a freshly rendered video into the cache and return the cached result."""
+        source = Path(result['video_path'])
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        target = self.video_path(key)
+        shutil.move(str(source), str(target))
+        try:
+            render_index.move(source, target, kind='cache', cache_key=key, quality=quality)
+        except Exception as e:
+            print(f"⚠️ Could not update render index for {key[:12]}: {e}")
+
+        # Remove the now-empty <tmpname>/<resolution>/ folders manim created
+        for parent in (source.parent, source.parent.parent):
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+
+        now = time.time()
+        meta = {
+            'scene_name': result['scene_name'],
+            'size': target.stat().st_size,
+            'content_key': content_key,
+            'quality': quality,
+            'created_at': now,
+            'last_access': now,
+        }
+        with self._lock:
+            self._entries[key] = meta
+            self._add_to_ladder(key, meta)
+            self._write_meta(key, meta)
+            self._evict()
+
+        cached = self._result(key, meta)
+        cached['cached'] = False
+        return cached
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries. Caller holds the lock."""
+        while len(self._entries) > self.max_entries:
+            key = min(self._entries, key=lambda k: self._entries[k]['last_access'])
+            if key in self._inflight:
+                break
+            self._delete(key)
+
+    def _delete(self, key):
+        """Remove one entry and its files. Caller holds the lock."""
+        meta = self._entries.pop(key, None)
+        if meta:
+            self._remove_from_ladder(key, meta)
+        render_index.remove(self.video_path(key))
+        remove_packages(self.video_path(key))
+        for path in (self.video_path(key), self.cache_dir / f"{key}.json"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        print(f"🗑️ Evicted cached render: {key}")
+
+    def evict(self, key):
+        """Remove a cached render (used by the disk janitor). Returns True if it was removed."""
+        with self._lock:
+            if key in self._inflight:
+                return False
+            self._delete(key)
+        return True
+
+    def get_or_render(self, code, quality, render_fn):
+        """
+        Return the cached render of `code`, rendering it with `render_fn` on a miss.
+
+        Only one render per key runs at a time; concurrent callers for the same
+        key wait for it and share its result.
+        """
+        key = render_key(code, quality)
+
+        cached = self.lookup(key)
+        if cached:
+            print(f"⚡ Render cache hit: {key[:12]}")
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = {'event': threading.Event(), 'result': None}
+                self._inflight[key] = flight
+                self.misses += 1
+                owner = True
+            else:
+                self.collapsed += 1
+                owner = False
+
+        if not owner:
+            # Someone else is rendering this exact code; share their result
+            print(f"⏳ Joining in-flight render: {key[:12]}")
+            flight['event'].wait()
+            return flight['result']
+
+        try:
+            flight['result'] = self._render(key, code, quality, render_fn)
+        except Exception as e:
+            flight['result'] = {
+                'success': False,
+                'error': str(e),
+                'video_path': None
+            }
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight['event'].set()
+        return flight['result']
+
+    def _render(self, key, code, quality, render_fn):
+        result = render_fn(code, quality=quality, preview=False, output_name=key[:16])
+        # A degraded render left scenes out; render it properly next time
+        if not result.get('success') or result.get('degraded'):
+            return result
+        try:
+            cached = self.store(key, result, content_key=content_key(code), quality=quality)
+        except OSError as e:
+            print(f"⚠️ Could not store render in cache: {e}")
+            return result
+        if config.VIDEO_HLS_ENABLED:
+            try:
+                package_hls(cached['video_path'])
+            except Exception as e:
+                print(f"⚠️ HLS packaging failed for {key[:12]}: {e}")
+        return cached
+
+    def in_flight_keys(self):
+        with self._lock:
+            return set(self._inflight)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(meta.get('size', 0) for meta in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'collapsed': self.collapsed,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'in_flight': len(self._inflight),
+            }
+
+
+render_cache = RenderCache(
+    os.path.join('renders', 'videos', 'cache'),
+    max_entries=config.RENDER_CACHE_MAX_ENTRIES,
+)
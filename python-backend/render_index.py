@@ -0,0 +1,159 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(path):
+    return os.path.normpath(os.path.abspath(str(path)))
+
+
+class RenderIndex:
+    """
+    SQLite manifest of every rendered video on disk.
+
+    Rows are written when a render finishes (path, size, scene, quality,
+    content hash, timestamps), so finding, serving and evicting outputs are
+    indexed lookups instead of walks over the renders/ tree. `kind` is
+    'output' for plain renders and 'cache' for files owned by the render cache.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS renders (
+                    path TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL DEFAULT 'output',
+                    scene TEXT,
+                    quality TEXT,
+                    cache_key TEXT,
+                    hash TEXT,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_served REAL,
+                    serve_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS renders_kind_created ON renders (kind, created_at)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS renders_recency ON renders (COALESCE(last_served, created_at))')
+
+    def record(self, path, scene=None, quality=None, cache_key=None, kind='output', created_at=None):
+        """Add (or refresh) a finished video. Returns its row as a dict."""
+        path = _normalize(path)
+        row = {
+            'path': path,
+            'kind': kind,
+            'scene': scene,
+            'quality': quality,
+            'cache_key': cache_key,
+            'hash': file_hash(path),
+            'size': os.path.getsize(path),
+            'created_at': created_at or time.time(),
+        }
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO renders (path, kind, scene, quality, cache_key, hash, size, created_at)
+                VALUES (:path, :kind, :scene, :quality, :cache_key, :hash, :size, :created_at)
+            ''', row)
+        return row
+
+    def move(self, old_path, new_path, **changes):
+        """Point a row at the file's new location (e.g. after the render cache adopts it)."""
+        old_path, new_path = _normalize(old_path), _normalize(new_path)
+        allowed = {key: value for key, value in changes.items() if key in ('kind', 'cache_key', 'quality', 'scene')}
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM renders WHERE path = ?', (new_path,))
+            updated = self._conn.execute('UPDATE renders SET path = ? WHERE path = ?', (new_path, old_path)).rowcount
+            for key, value in allowed.items():
+                self._conn.execute(f'UPDATE renders SET {key} = ? WHERE path = ?', (value, new_path))
+        if not updated:
+            # Rendered before the index existed; hash the file now
+            self.record(new_path, **allowed)
+
+    def get(self, path):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM renders WHERE path = ?', (_normalize(path),)).fetchone()
+        return dict(row) if row else None
+
+    def remove(self, path):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM renders WHERE path = ?', (_normalize(path),))
+
+    def touch(self, path):
+        """Note that a video was just served. Returns False if it isn't indexed."""
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                'UPDATE renders SET last_served = ?, serve_count = serve_count + 1 WHERE path = ?',
+                (time.time(), _normalize(path))
+            ).rowcount
+        return bool(updated)
+
+    def total_bytes(self):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM renders').fetchone()[0]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM renders').fetchone()[0]
+
+    def eviction_candidates(self, policy='lru', limit=100):
+        """
+        Rows in eviction order: least recently served first ('lru'), or least
+        often served first with recency as the tie-break ('lfu'). Videos that
+        were never served count from their creation time.
+        """
+        order = 'COALESCE(last_served, created_at)'
+        if policy == 'lfu':
+            order = f'serve_count, {order}'
+        with self._lock:
+            rows = self._conn.execute(f'SELECT * FROM renders ORDER BY {order} LIMIT ?', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def backfill(self, videos_dir, cache_dir):
+        """Index videos left on disk before the index existed. Walks the tree once."""
+        videos_dir = os.path.abspath(videos_dir)
+        cache_dir = os.path.abspath(cache_dir)
+        added = 0
+        for root, dirs, files in os.walk(videos_dir):
+            dirs[:] = [d for d in dirs if d != 'partial_movie_files']
+            for name in files:
+                if not name.endswith('.mp4'):
+                    continue
+                path = os.path.join(root, name)
+                if self.get(path):
+                    continue
+                created_at = os.path.getmtime(path)
+                if root == cache_dir:
+                    self.record(path, kind='cache', cache_key=name[:-len('.mp4')], created_at=created_at)
+                else:
+                    self.record(path, created_at=created_at)
+                added += 1
+        return added
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT kind, COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes FROM renders GROUP BY kind'
+            ).fetchall()
+        return {row['kind']: {'files': row['files'], 'bytes': row['bytes']} for row in rows}
+
+
+render_index = RenderIndex(config.RENDER_INDEX_PATH)
@@ -0,0 +1,160 @@
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import config
+from render_cache import render_cache
+from render_index import render_index
+from video_packaging import remove_packages
+
+
+class RenderJanitor:
+    """
+    Background thread that keeps rendered videos under a byte quota.
+
+    Sweeps run every `interval` seconds (or right after a render when woken)
+    and delete videos in eviction order from the render index: least recently
+    served first ('lru') or least often served first ('lfu'), where serving
+    is recorded by /video. Videos that were just rendered, are still being
+    rendered, or were recently returned to a client are pinned and skipped.
+    """
+
+    def __init__(self, quota_bytes, interval=60, policy='lru', pin_seconds=600,
+                 videos_dir=os.path.join('renders', 'videos')):
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self.policy = policy
+        self.pin_seconds = pin_seconds
+        self.videos_dir = videos_dir
+        self._pins = {}  # normalized path -> pinned until
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {
+            'sweeps': 0,
+            'files_evicted': 0,
+            'bytes_reclaimed': 0,
+            'skipped_pinned': 0,
+            'last_sweep_at': None,
+            'last_sweep_seconds': None,
+        }
+
+    def start(self):
+        """Start the sweep thread once (safe to call repeatedly)."""
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name='render-janitor', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Ask for a sweep soon, e.g. after a render added a file."""
+        self.start()
+        self._wake.set()
+
+    def pin(self, video_path, seconds=None):
+        """Keep a video from being evicted for `seconds` (default pin_seconds)."""
+        if not video_path:
+            return
+        until = time.time() + (seconds or self.pin_seconds)
+        with self._lock:
+            key = os.path.normpath(os.path.abspath(video_path))
+            self._pins[key] = max(until, self._pins.get(key, 0))
+
+    def _pinned(self, row, now):
+        with self._lock:
+            if self._pins.get(row['path'], 0) > now:
+                return True
+        # Just rendered: the client may not have asked for it yet
+        if now - row['created_at'] < self.pin_seconds:
+            return True
+        return row['kind'] == 'cache' and row['cache_key'] in render_cache.in_flight_keys()
+
+    def _delete(self, row):
+        """Delete one indexed video through whoever owns it. Returns True on success."""
+        if row['kind'] == 'cache' and row['cache_key']:
+            return render_cache.evict(row['cache_key'])
+
+        try:
+            os.unlink(row['path'])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not delete {row['path']}: {e}")
+            return False
+        render_index.remove(row['path'])
+        remove_packages(row['path'])
+
+        # Remove the now-empty <module>/<resolution>/ folders manim created
+        parent = Path(row['path']).parent
+        shutil.rmtree(parent / 'partial_movie_files', ignore_errors=True)
+        for folder in (parent, parent.parent):
+            try:
+                folder.rmdir()
+            except OSError:
+                break
+        return True
+
+    def sweep(self):
+        """Evict videos until the indexed total fits the quota. Returns bytes reclaimed."""
+        start = time.time()
+        with self._lock:
+            self._pins = {path: until for path, until in self._pins.items() if until > start}
+
+        total = render_index.total_bytes()
+        reclaimed = 0
+        if total > self.quota_bytes:
+            for row in render_index.eviction_candidates(self.policy, limit=1000):
+                if total - reclaimed <= self.quota_bytes:
+                    break
+                if self._pinned(row, start):
+                    self.stats['skipped_pinned'] += 1
+                    continue
+                if self._delete(row):
+                    reclaimed += row['size']
+                    self.stats['files_evicted'] += 1
+                    print(f"🧹 Evicted {row['path']} ({row['size'] / 1024 / 1024:.1f} MB)")
+
+        self.stats['sweeps'] += 1
+        self.stats['bytes_reclaimed'] += reclaimed
+        self.stats['last_sweep_at'] = start
+        self.stats['last_sweep_seconds'] = round(time.time() - start, 3)
+        if reclaimed:
+            print(f"🧹 Janitor reclaimed {reclaimed / 1024 / 1024:.1f} MB "
+                  f"({(total - reclaimed) / 1024 / 1024:.1f} / {self.quota_bytes / 1024 / 1024:.0f} MB used)")
+        return reclaimed
+
+    def _run(self):
+        if not render_index.count():
+            # First run with an empty index: pick up videos rendered before it existed
+            added = render_index.backfill(self.videos_dir, render_cache.cache_dir)
+            if added:
+                print(f"📦 Indexed {added} existing renders")
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Render janitor sweep failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def describe(self):
+        with self._lock:
+            pinned = len(self._pins)
+        return {
+            'quota_bytes': self.quota_bytes,
+            'used_bytes': render_index.total_bytes(),
+            'policy': self.policy,
+            'pinned': pinned,
+            **self.stats,
+        }
+
+
+render_janitor = RenderJanitor(
+    quota_bytes=config.RENDER_DISK_QUOTA_MB * 1024 * 1024,
+    interval=config.RENDER_JANITOR_INTERVAL,
+    policy=config.RENDER_EVICTION_POLICY,
+    pin_seconds=config.RENDER_PIN_SECONDS,
+)
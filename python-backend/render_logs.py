@@ -0,0 +1,286 @@
+import ast
+import os
+import re
+import threading
+from collections import deque, OrderedDict
+
+import config
+
+
+# tqdm bar manim redraws while an animation renders: "Animation 3: Create(Circle):  45%|####  | 7/15 ..."
+PROGRESS_RE = re.compile(r'Animation (\d+)\s*:.*?(\d+)%\|')
+# Logged once an animation's partial movie exists
+ANIMATION_DONE_RE = re.compile(r'Animation (\d+)\s*: (?:Partial movie file written|Using cached data)')
+# Summary at the end of a successful render
+PLAYED_RE = re.compile(r'Played (\d+) animations')
+
+ANIMATION_METHODS = ('play', 'wait', 'wait_until')
+
+
+def count_animations(code, scene_name):
+    """
+    Number of animations `scene_name` plays (self.play/self.wait calls), or
+    None when that can't be known up front: calls inside loops or helper
+    methods, or code that doesn't parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    scene = next((node for node in tree.body
+                  if isinstance(node, ast.ClassDef) and node.name == scene_name), None)
+    if scene is None:
+        return None
+    construct = next((item for item in scene.body
+                      if isinstance(item, ast.FunctionDef) and item.name == 'construct'), None)
+    if construct is None:
+        return None
+
+    def is_animation(node):
+        return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ANIMATION_METHODS
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == 'self')
+
+    total = sum(1 for node in ast.walk(scene) if is_animation(node))
+    direct = sum(1 for statement in construct.body
+                 if isinstance(statement, ast.Expr) and is_animation(statement.value))
+    return direct if direct == total else None
+
+
+class RenderLog:
+    """
+    Output of one render job, streamed to a file as manim writes it.
+
+    Only the last `tail_lines` lines stay in memory (for error messages), and
+    manim's progress bars are parsed into per-piece progress instead of being
+    written out on every redraw. A job rendered in parallel pieces shares one
+    log; each piece reports through piece(name). Warm render workers append
+    to a file of their own (the main file, or a piece's file) that sync()
+    parses and, for pieces, copies into the main file.
+    """
+
+    def __init__(self, log_id, log_dir=None, tail_lines=None):
+        self.log_id = log_id
+        self.path = os.path.join(log_dir or config.RENDER_LOG_DIR, f"{log_id}.log")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._tail = deque(maxlen=tail_lines or config.RENDER_LOG_TAIL_LINES)
+        self._pieces = {}   # piece name -> progress of that piece
+        self._file = None
+        # file path -> piece it belongs to, bytes already parsed and any
+        # unterminated line written by another process
+        self._sources = {self.path: {'piece': None, 'offset': 0, 'partial': ''}}
+        self._lock = threading.Lock()
+        self.finished = False
+
+    def piece(self, name):
+        """View of this log for one piece of a parallel render."""
+        root, ext = os.path.splitext(self.path)
+        piece = _LogPiece(self, name, f"{root}.{name}{ext}")
+        with self._lock:
+            self._sources.setdefault(piece.path, {'piece': name, 'offset': 0, 'partial': ''})
+        return piece
+
+    def _progress_of(self, piece):
+        return self._pieces.setdefault(piece, {'total': None, 'done': 0, 'current': None, 'percent': 0})
+
+    def expect(self, total, piece=None):
+        """Set how many animations a piece will play, if known."""
+        with self._lock:
+            self._progress_of(piece)['total'] = total
+
+    def _parse(self, line, piece):
+        """Update progress from one line. Returns True for progress bar redraws."""
+        progress = self._progress_of(piece)
+        match = PROGRESS_RE.search(line)
+        if match:
+            progress['current'] = int(match.group(1))
+            progress['percent'] = int(match.group(2))
+            # Only the finished bar is worth keeping
+            return progress['percent'] < 100
+        match = ANIMATION_DONE_RE.search(line)
+        if match:
+            progress['done'] = max(progress['done'], int(match.group(1)) + 1)
+            progress['current'] = None
+            return False
+        match = PLAYED_RE.search(line)
+        if match:
+            progress['done'] = progress['total'] = int(match.group(1))
+            progress['current'] = None
+        return False
+
+    def write(self, line, piece=None):
+        """Record one line of output."""
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            return
+        with self._lock:
+            if not self._parse(line, piece):
+                self._record(line, piece)
+
+    def _record(self, line, piece):
+        """Keep a line in the tail and the main file. Caller holds the lock."""
+        if piece is not None:
+            line = f"[{piece}] {line}"
+        self._tail.append(line)
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8', errors='replace')
+        self._file.write(line + '\n')
+        self._file.flush()
+        self._sources[self.path]['offset'] = self._file.tell()
+
+    def consume(self, stream, piece=None):
+        """Write every line of a text stream (e.g. a subprocess's stdout) until EOF."""
+        for line in stream:
+            self.write(line, piece)
+
+    def sync(self):
+        """
+        Parse output other processes appended to the log's files directly
+        (warm render workers write their output there instead of through a
+        pipe). Each file's lines are credited to the piece that owns it.
+        """
+        with self._lock:
+            for path, source in self._sources.items():
+                self._sync_source(path, source)
+
+    def _sync_source(self, path, source):
+        """Parse what was appended to one file since the last sync. Caller holds the lock."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size <= source['offset']:
+            return
+        with open(path, 'r', encoding='utf-8', errors='replace') as log_file:
+            log_file.seek(source['offset'])
+            chunk = source['partial'] + log_file.read()
+            source['offset'] = log_file.tell()
+        lines = re.split(r'[\r\n]', chunk)
+        source['partial'] = lines.pop()
+        for line in lines:
+            if not line.strip() or self._parse(line, source['piece']):
+                continue
+            if source['piece'] is None:
+                # Already in the main file
+                self._tail.append(line)
+            else:
+                self._record(line, source['piece'])
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self.finished = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            # Piece files were copied into the main file by sync()
+            for path, source in self._sources.items():
+                if source['piece'] is not None:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+
+    def tail(self, lines=None):
+        """The last lines of output (at most tail_lines), oldest first."""
+        with self._lock:
+            tail = list(self._tail)
+        return tail[-lines:] if lines else tail
+
+    def error_text(self, default='Unknown error'):
+        return '\n'.join(self.tail()) or default
+
+    def progress(self):
+        """
+        Progress across all pieces: animations finished, how many there are
+        (None when a piece's count couldn't be estimated), the 1-based number
+        of the animation rendering now, its percent, and an overall percent.
+        """
+        self.sync()
+        with self._lock:
+            pieces = list(self._pieces.values())
+            finished = self.finished
+        done = sum(piece['done'] for piece in pieces)
+        running = [piece for piece in pieces if piece['current'] is not None]
+        totals = [piece['total'] for piece in pieces]
+        total = sum(totals) if pieces and None not in totals else None
+
+        percent = None
+        if finished:
+            percent = 100.0
+        elif total:
+            partial = sum(piece['percent'] for piece in running) / 100
+            percent = round(min(99.0, 100 * (done + partial) / total), 1)
+        return {
+            'animations_done': done,
+            'animations_total': total,
+            'current_animation': running[-1]['current'] + 1 if running else None,
+            'current_percent': running[-1]['percent'] if running else None,
+            'percent': percent,
+        }
+
+
+class _LogPiece:
+    """RenderLog bound to one piece name (see RenderLog.piece)."""
+
+    def __init__(self, log, name, path):
+        self._log = log
+        self.name = name
+        self.path = path  # where a warm worker writes this piece's output
+
+    def expect(self, total):
+        self._log.expect(total, piece=self.name)
+
+    def write(self, line):
+        self._log.write(line, piece=self.name)
+
+    def consume(self, stream):
+        self._log.consume(stream, piece=self.name)
+
+    def sync(self):
+        self._log.sync()
+
+    def tail(self, lines=None):
+        prefix = f"[{self.name}] "
+        own = [line[len(prefix):] for line in self._log.tail() if line.startswith(prefix)]
+        return own[-lines:] if lines else own
+
+    def error_text(self, default='Unknown error'):
+        return '\n'.join(self.tail()) or default
+
+    def close(self):
+        # The parallel render closes the shared log once every piece is done
+        pass
+
+
+class RenderLogStore:
+    """
+    The most recent `max_logs` render logs by id. Older logs are forgotten and
+    their files deleted, so logs take bounded memory and disk.
+    """
+
+    def __init__(self, max_logs=200, log_dir=None):
+        self.max_logs = max_logs
+        self.log_dir = log_dir
+        self._logs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, log_id):
+        log = RenderLog(log_id, log_dir=self.log_dir)
+        with self._lock:
+            self._logs[log_id] = log
+            while len(self._logs) > self.max_logs:
+                _, old = self._logs.popitem(last=False)
+                old.close()
+                try:
+                    os.unlink(old.path)
+                except OSError:
+                    pass
+        return log
+
+    def get(self, log_id):
+        with self._lock:
+            return self._logs.get(log_id)
+
+
+render_logs = RenderLogStore(max_logs=config.RENDER_LOG_HISTORY)
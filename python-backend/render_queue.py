@@ -0,0 +1,573 @@
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import deque, OrderedDict
+
+import config
+from manim_renderer import render_manim_scene
+from render_cache import render_cache, render_key, content_key, quality_rank
+from render_worker import warm_pool
+from partial_cache import partial_cache
+from render_janitor import render_janitor
+from preflight import check_code
+from parallel_render import render_parallel, plan_chunks
+from render_logs import render_logs
+
+
+class RenderQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+    pass
+
+
+# Dispatch priorities: background jobs only start when no normal job fits
+PRIORITY_NORMAL = 0
+PRIORITY_BACKGROUND = 1
+
+
+class RenderJob:
+    """A single render request tracked by the RenderQueue."""
+
+    def __init__(self, code, quality='l', chat_id=None, user_request=None,
+                 speculative=False, background=False, parallelism=1):
+        self.job_id = uuid.uuid4().hex
+        self.code = code
+        self.quality = quality
+        self.chat_id = chat_id
+        self.user_request = user_request
+        # Speculative jobs were started before anyone asked for the video
+        self.speculative = speculative
+        # Background jobs (quality upgrades) yield to everything else
+        self.background = background
+        # Processes the render will use (scenes/sections rendered at once)
+        self.parallelism = parallelism
+        self.cache_key = render_key(code, quality)
+        self.content_key = content_key(code)
+        self.status = 'queued'  # queued, running, completed, failed, cancelled
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        # Streamed manim output and progress, created when the job starts
+        self.log = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    @property
+    def priority(self):
+        return PRIORITY_BACKGROUND if self.speculative or self.background else PRIORITY_NORMAL
+
+    def wait(self, timeout=None):
+        """Block until the job has finished. Returns True if it finished."""
+        return self._done.wait(timeout)
+
+    def elapsed(self):
+        """Seconds spent running (or queued + running if still waiting)."""
+        start = self.started_at or self.submitted_at
+        end = self.finished_at or time.time()
+        return end - start
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'quality': self.quality,
+            'chat_id': self.chat_id,
+            'speculative': self.speculative,
+            'background': self.background,
+            'parallelism': self.parallelism,
+            'cache_key': self.cache_key,
+            'content_key': self.content_key,
+            'cached': bool(self.result and self.result.get('cached')),
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed': round(self.elapsed(), 2),
+            'progress': self.log.progress() if self.log else None,
+        }
+
+
+def available_memory_mb():
+    """Memory available for new processes in MB, or None if it can't be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except ImportError:
+        pass
+    
+    # Linux fallback when psutil isn't installed
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_render_capacity():
+    """
+    Size the render budget from CPU cores and free memory.
+
+    One unit of capacity is one low-quality manim render; higher qualities
+    consume more units (see config.RENDER_QUALITY_WEIGHTS).
+    """
+    cores = os.cpu_count() or 1
+    # Leave a core free for Flask and the LLM calls
+    capacity = max(1, cores - 1)
+    
+    memory_mb = available_memory_mb()
+    if memory_mb is not None:
+        capacity = min(capacity, max(1, int(memory_mb // config.RENDER_MEMORY_PER_UNIT_MB)))
+    
+    return capacity
+
+
+class RenderQueue:
+    """
+    Bounded queue of render jobs processed by background worker threads.
+
+    Submitting a job returns immediately; callers poll the job (or wait on it)
+    instead of holding a request thread for the whole manim render.
+
+    Each job costs a weight based on its quality, and jobs only start while the
+    total weight of running renders fits in `capacity`, so the box is never
+    oversubscribed. Waiting jobs are grouped per chat session and dispatched
+    round-robin so one busy session can't starve the others.
+    """
+
+    def __init__(self, capacity=1, max_size=20, max_per_session=3,
+                 history_size=200, quality_weights=None,
+                 render_fn=render_manim_scene):
+        self.capacity = max(1, capacity)
+        self.max_size = max_size
+        self.max_per_session = max_per_session
+        self.history_size = history_size
+        self.quality_weights = quality_weights or {'l': 1}
+        self.render_fn = render_fn
+
+        self._jobs = OrderedDict()      # job_id -> RenderJob, oldest first
+        self._sessions = OrderedDict()  # session key -> deque of waiting jobs, in rotation order
+        self._active = {}               # cache key -> unfinished job, to collapse duplicates
+        self._running = set()
+        self._running_weight = 0
+        self._durations = {}            # quality -> deque of recent run times
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def weight(self, quality):
+        """Capacity units a render at this quality consumes."""
+        return min(self.quality_weights.get(quality, 1), self.capacity)
+
+    def job_weight(self, job):
+        """Capacity units a job consumes, counting each process it renders with."""
+        return min(self.weight(job.quality) * job.parallelism, self.capacity)
+
+    def _ensure_workers(self):
+        """Start worker threads lazily so importing the module has no side effects."""
+        if self._workers:
+            return
+        # The smallest job weighs 1, so capacity threads can always fill the budget
+        for i in range(self.capacity):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"render-worker-{i}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _pending_count(self):
+        return sum(len(jobs) for jobs in self._sessions.values())
+
+    @staticmethod
+    def _counted(jobs, low_priority):
+        """
+        Waiting jobs that count against the queue limits for a new submission.
+        A normal request only counts other normal requests, so speculative
+        jobs and ladder upgrades never make it fail; a speculative or
+        background one counts everything and is refused when the queue is busy.
+        """
+        return sum(1 for job in jobs if low_priority or job.priority == PRIORITY_NORMAL)
+
+    def submit(self, code, quality='l', chat_id=None, user_request=None, speculative=False,
+               background=False):
+        """
+        Queue a render and return its RenderJob. Raises RenderQueueFull, or
+        PreflightError if the code fails validation (see preflight.py).
+
+        Code that is already in the render cache comes back as a completed job
+        without touching the workers, and code identical to a job that is still
+        queued or running returns that existing job. A normal request attaching
+        to a speculative or background job promotes it to normal priority.
+        """
+        session = chat_id or ''
+        cached = render_cache.lookup(render_key(code, quality))
+        if cached:
+            job = RenderJob(code, quality=quality, chat_id=chat_id,
+                            user_request=user_request, speculative=speculative,
+                            background=background)
+            job.status = 'completed'
+            job.started_at = job.finished_at = job.submitted_at
+            job.result = cached
+            job._done.set()
+            with self._cond:
+                self._jobs[job.job_id] = job
+                self._trim_history()
+            print(f"⚡ Render job {job.job_id} served from cache")
+            return job
+
+        if config.PREFLIGHT_ENABLED:
+            # Reject broken code in milliseconds instead of after starting manim
+            check_code(code)
+
+        parallelism = 1
+        if config.PARALLEL_RENDER_ENABLED:
+            pieces = len(plan_chunks(code, split_sections=config.PARALLEL_SPLIT_SECTIONS))
+            parallelism = max(1, min(pieces, config.PARALLEL_RENDER_WORKERS))
+
+        with self._cond:
+            active = self._active.get(render_key(code, quality))
+            if active and not active.finished:
+                print(f"🔗 Collapsing duplicate render into job {active.job_id}")
+                if active.priority > PRIORITY_NORMAL and not (speculative or background):
+                    active.speculative = active.background = False
+                    self._cond.notify_all()
+                return active
+
+            low_priority = speculative or background
+            waiting = [job for jobs in self._sessions.values() for job in jobs]
+            if self._counted(waiting, low_priority) >= self.max_size:
+                raise RenderQueueFull(
+                    f"Render queue is full ({self.max_size} jobs waiting)"
+                )
+            session_jobs = self._sessions.get(session)
+            if session and session_jobs and self._counted(session_jobs, low_priority) >= self.max_per_session:
+                raise RenderQueueFull(
+                    f"Too many renders waiting for this chat ({self.max_per_session} max)"
+                )
+            job = RenderJob(code, quality=quality, chat_id=chat_id,
+                            user_request=user_request, speculative=speculative,
+                            background=background, parallelism=parallelism)
+            self._jobs[job.job_id] = job
+            self._sessions.setdefault(session, deque()).append(job)
+            self._active[job.cache_key] = job
+            self._trim_history()
+            self._ensure_workers()
+            self._cond.notify_all()
+
+        kind = 'speculative render' if speculative else 'background render' if background else 'render'
+        print(f"📥 Queued {kind} job {job.job_id} (quality: {quality}, position: {self.position(job)})")
+        return job
+
+    def submit_ladder(self, code, quality='h', chat_id=None, user_request=None, ladder=None):
+        """
+        Queue a progressive render: the lowest tier first, then better tiers up
+        to `quality` in the background. Returns the jobs, preview first.
+
+        Tiers come from `ladder` (config.RENDER_LADDER by default); the preview
+        is queued at normal priority, upgrades only run when nothing else waits.
+        """
+        ladder = ladder or config.RENDER_LADDER
+        tiers = [q for q in ladder if quality_rank(q) < quality_rank(quality)] + [quality]
+        jobs = [self.submit(code, quality=tiers[0], chat_id=chat_id, user_request=user_request)]
+        for tier in tiers[1:]:
+            try:
+                jobs.append(self.submit(code, quality=tier, chat_id=chat_id,
+                                        user_request=user_request, background=True))
+            except RenderQueueFull as e:
+                # The preview is what the user waits for; upgrades are best-effort
+                print(f"⚠️ Skipping {tier} upgrade: {e}")
+                break
+        return jobs
+
+    def ladder_status(self, content_key):
+        """
+        Every quality tier known for one piece of code: cached renders plus
+        tracked jobs still queued or running, keyed by quality flag.
+        """
+        tiers = {}
+        for quality, result in render_cache.ladder(content_key).items():
+            tiers[quality] = {'status': 'completed', 'video_path': result['video_path']}
+        with self._cond:
+            jobs = [job for job in self._jobs.values() if job.content_key == content_key]
+        for job in jobs:
+            if job.quality in tiers and tiers[job.quality]['status'] == 'completed':
+                continue
+            if job.finished and job.status != 'failed':
+                continue
+            tiers[job.quality] = {'status': job.status, 'job_id': job.job_id}
+        return {
+            'content_key': content_key,
+            'tiers': {q: tiers[q] for q in sorted(tiers, key=quality_rank)},
+            'pending': sum(1 for tier in tiers.values() if tier['status'] in ('queued', 'running')),
+        }
+
+    def cancel_speculative(self, chat_id, keep=None):
+        """
+        Cancel this chat's speculative jobs that haven't started yet (except `keep`).
+
+        Called when the session moves on, e.g. a new message was sent. Jobs that
+        are already running are left to finish since their result is cached.
+        """
+        cancelled = []
+        with self._cond:
+            jobs = self._sessions.get(chat_id or '')
+            if not jobs:
+                return 0
+            for job in list(jobs):
+                if job.speculative and job is not keep:
+                    jobs.remove(job)
+                    cancelled.append(job)
+            if not jobs:
+                del self._sessions[chat_id or '']
+            for job in cancelled:
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                job.result = {
+                    'success': False,
+                    'error': 'Speculative render cancelled',
+                    'video_path': None
+                }
+                if self._active.get(job.cache_key) is job:
+                    del self._active[job.cache_key]
+        for job in cancelled:
+            job._done.set()
+            print(f"🚫 Cancelled speculative render job {job.job_id}")
+        return len(cancelled)
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def _dispatch_order(self):
+        """Waiting jobs in the order round-robin dispatch would start them."""
+        queues = [list(jobs) for jobs in self._sessions.values()]
+        order = []
+        depth = 0
+        while True:
+            layer = [jobs[depth] for jobs in queues if depth < len(jobs)]
+            if not layer:
+                # Background jobs only run once normal work has drained
+                return sorted(order, key=lambda job: job.priority)
+            order.extend(layer)
+            depth += 1
+
+    def position(self, job):
+        """1-based position in the waiting line, 0 once the job has started."""
+        with self._cond:
+            try:
+                return self._dispatch_order().index(job) + 1
+            except ValueError:
+                return 0
+
+    def average_duration(self, quality):
+        with self._cond:
+            samples = self._durations.get(quality)
+            if not samples:
+                # Fall back to any quality we have data for, scaled by weight
+                scaled = [d * self.weight(quality) / self.weight(q)
+                          for q, durations in self._durations.items() for d in durations]
+                samples = scaled
+            if not samples:
+                return None
+            return sum(samples) / len(samples)
+
+    def eta(self, job):
+        """Estimated seconds until the job finishes, or None if unknown."""
+        if job.finished:
+            return 0.0
+        avg = self.average_duration(job.quality)
+        if avg is None:
+            return None
+
+        if job.status == 'running':
+            return max(0.0, avg - job.elapsed())
+
+        with self._cond:
+            order = self._dispatch_order()
+            ahead = order[:order.index(job)] if job in order else []
+            running = list(self._running)
+
+        # Weighted work ahead of us drains through the whole capacity at once
+        work = 0.0
+        for other in running:
+            other_avg = self.average_duration(other.quality) or avg
+            work += max(0.0, other_avg - other.elapsed()) * self.job_weight(other)
+        for other in ahead:
+            other_avg = self.average_duration(other.quality) or avg
+            work += other_avg * self.job_weight(other)
+        return work / self.capacity + avg
+
+    def describe(self, job):
+        """Job status dict including queue position and ETA."""
+        info = job.to_dict()
+        info['position'] = self.position(job)
+        eta = self.eta(job)
+        info['eta_seconds'] = round(eta, 1) if eta is not None else None
+        return info
+
+    def stats(self):
+        with self._cond:
+            return {
+                'capacity': self.capacity,
+                'capacity_in_use': self._running_weight,
+                'queued': self._pending_count(),
+                'running': len(self._running),
+                'sessions_waiting': len(self._sessions),
+                'max_size': self.max_size,
+                'tracked_jobs': len(self._jobs),
+                'cache': render_cache.stats(),
+                'disk': render_janitor.describe(),
+                'backend': config.RENDER_BACKEND,
+                'partial_cache': partial_cache.stats(),
+            }
+
+    def _trim_history(self):
+        """Forget the oldest finished jobs once history_size is exceeded."""
+        excess = len(self._jobs) - self.history_size
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs.keys()):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _fits(self, job):
+        # An idle pool always accepts a job, whatever its weight
+        return not self._running or self._running_weight + self.job_weight(job) <= self.capacity
+
+    def _next_job(self):
+        """
+        Pop the next job to run, or None if nothing fits right now.
+
+        Sessions are visited in rotation order. A heavy job at the front of the
+        rotation may be skipped by lighter jobs, but only until it has waited
+        RENDER_STARVATION_SECONDS; after that it holds the line until it fits.
+        Background (speculative) jobs are only considered when no normal-priority
+        job is waiting.
+        """
+        waiting_normal = any(job.priority == PRIORITY_NORMAL
+                             for jobs in self._sessions.values() for job in jobs)
+        for index, (session, jobs) in enumerate(self._sessions.items()):
+            if waiting_normal:
+                head = next((job for job in jobs if job.priority == PRIORITY_NORMAL), None)
+                if head is None:
+                    continue
+            else:
+                head = jobs[0]
+            if not self._fits(head):
+                if index == 0 and time.time() - head.submitted_at > config.RENDER_STARVATION_SECONDS:
+                    return None
+                continue
+            jobs.remove(head)
+            # Rotate: this session goes to the back of the line
+            del self._sessions[session]
+            if jobs:
+                self._sessions[session] = jobs
+            return head
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait(timeout=1)
+                    job = self._next_job()
+                self._running.add(job)
+                self._running_weight += self.job_weight(job)
+                job.status = 'running'
+                job.started_at = time.time()
+                job.log = render_logs.create(job.job_id)
+
+            print(f"▶️ Starting render job {job.job_id} (weight {self.job_weight(job)}/{self.capacity})")
+            try:
+                render_fn = functools.partial(self.render_fn, chat_id=job.chat_id, log=job.log)
+                result = render_cache.get_or_render(job.code, job.quality, render_fn)
+            except Exception as e:
+                print(f"❌ Render job {job.job_id} crashed: {e}")
+                result = {
+                    'success': False,
+                    'error': str(e),
+                    'video_path': None
+                }
+            job.log.close()
+
+            with self._cond:
+                job.result = result
+                job.finished_at = time.time()
+                job.status = 'completed' if result.get('success') else 'failed'
+                self._running.discard(job)
+                self._running_weight -= self.job_weight(job)
+                if self._active.get(job.cache_key) is job:
+                    del self._active[job.cache_key]
+                samples = self._durations.setdefault(job.quality, deque(maxlen=20))
+                samples.append(job.finished_at - job.started_at)
+                # Freed capacity may let waiting jobs start
+                self._cond.notify_all()
+            job._done.set()
+
+            print(f"{'✅' if job.status == 'completed' else '❌'} Render job {job.job_id} {job.status} in {job.elapsed():.1f}s")
+
+
+def render_scene(code, output_dir="renders", quality='l', preview=False, output_name=None,
+                 cache_partials=False, scene_name=None, log=None, module_name='scene'):
+    """Render with the configured backend (warm worker pool or manim subprocess)."""
+    if config.RENDER_BACKEND == 'warm':
+        return warm_pool.render(code, output_dir=output_dir, quality=quality, preview=preview,
+                                output_name=output_name, cache_partials=cache_partials,
+                                scene_name=scene_name, log=log, module_name=module_name)
+    return render_manim_scene(code, output_dir=output_dir, quality=quality, preview=preview,
+                              output_name=output_name, cache_partials=cache_partials,
+                              scene_name=scene_name, log=log, module_name=module_name)
+
+
+def render_and_cleanup(code, quality='l', preview=False, output_name=None, chat_id=None, log=None):
+    """Render a scene, then let the janitor prune old renders in the background."""
+    if config.PARTIAL_CACHE_ENABLED and chat_id:
+        # Reuse this chat's partial movie files so only changed animations re-render
+        with partial_cache.session(chat_id) as session_dir:
+            result = _render_job(code, quality=quality, preview=preview, output_name=output_name,
+                                 log=log, output_dir=session_dir, cache_partials=True)
+            if result.get('success'):
+                # Session dirs live outside renders/videos, which is all /video serves
+                result['video_path'] = partial_cache.publish(result['video_path'])
+    else:
+        result = _render_job(code, quality=quality, preview=preview, output_name=output_name, log=log)
+    if result.get('success'):
+        # New video on disk; eviction runs on the janitor thread, off the request path
+        render_janitor.wake()
+    return result
+
+
+def _render_job(code, quality='l', preview=False, output_name=None, log=None, output_dir="renders",
+                cache_partials=False):
+    if config.PARALLEL_RENDER_ENABLED and not preview:
+        # Every scene (and section, if enabled) in its own process, joined at the end
+        return render_parallel(code, functools.partial(render_scene, cache_partials=cache_partials),
+                               output_dir=output_dir, quality=quality, output_name=output_name,
+                               split_sections=config.PARALLEL_SPLIT_SECTIONS, log=log)
+    return render_scene(code, output_dir=output_dir, quality=quality, preview=preview,
+                        output_name=output_name, cache_partials=cache_partials, log=log)
+
+
+render_queue = RenderQueue(
+    capacity=config.RENDER_CAPACITY or default_render_capacity(),
+    max_size=config.RENDER_QUEUE_MAX_SIZE,
+    max_per_session=config.RENDER_MAX_JOBS_PER_SESSION,
+    history_size=config.RENDER_JOB_HISTORY,
+    quality_weights=config.RENDER_QUALITY_WEIGHTS,
+    render_fn=render_and_cleanup,
+)
@@ -0,0 +1,384 @@
+import contextlib
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import config
+from manim_renderer import render_manim_scene, extract_scene_class_name, record_render
+from render_logs import render_logs, count_animations
+
+
+# manim's config names for the -q<flag> quality flags
+QUALITY_NAMES = {
+    'l': 'low_quality',
+    'm': 'medium_quality',
+    'h': 'high_quality',
+    'p': 'production_quality',
+    'k': 'fourk_quality',
+}
+
+
+def _memory_usage_mb():
+    """Resident memory of the current process in MB, or None if unknown."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+        # ru_maxrss is KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return None
+
+
+def _render_in_process(manim, job):
+    """Render one job inside an already-warm worker. Runs in the child process."""
+    code = job['code']
+    scene_name = job['scene_name']
+    unique_id = job['unique_id']
+
+    if job['cache_partials']:
+        # Stable module name so manim finds the previous partial movie files
+        temp_file_path = os.path.join(job['output_dir'], f"{job['module_name']}.py")
+        with open(temp_file_path, 'w', encoding='utf-8') as scene_file:
+            scene_file.write(code)
+    else:
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8', prefix=unique_id) as temp_file:
+            temp_file.write(code)
+            temp_file_path = temp_file.name
+
+    overrides = {
+        'quality': QUALITY_NAMES.get(job['quality'], 'low_quality'),
+        'media_dir': job['output_dir'],
+        'input_file': temp_file_path,
+        'output_file': unique_id,
+        'disable_caching': not job['cache_partials'],
+        'preview': False,
+        'write_to_movie': True,
+    }
+    try:
+        # tempconfig restores manim.config afterwards, so it has to wrap the
+        # exec too: module-level `config.x = ...` lines would otherwise stick
+        # to the worker and leak into every later job
+        with manim.tempconfig(overrides):
+            # Fresh namespace per job so scenes can't leak state into each other
+            namespace = {'__name__': '__manim_scene__', '__file__': temp_file_path}
+            exec(compile(code, temp_file_path, 'exec'), namespace)
+            scene_class = namespace.get(scene_name)
+            if scene_class is None:
+                return {
+                    'success': False,
+                    'error': f"Scene class {scene_name} not found after executing the code",
+                    'video_path': None
+                }
+            # The scene's own config assignments win over the job's, as with the CLI,
+            # except for where the output goes
+            manim.config.update({key: overrides[key] for key in ('media_dir', 'input_file', 'output_file')})
+            scene = scene_class()
+            scene.render()
+            video_path = str(scene.renderer.file_writer.movie_file_path)
+
+        return {
+            'success': True,
+            'video_path': video_path,
+            'scene_name': scene_name,
+            'unique_id': unique_id,
+            'log_path': job['log_path']
+        }
+    except Exception:
+        return {
+            'success': False,
+            'error': traceback.format_exc(),
+            'video_path': None
+        }
+    finally:
+        try:
+            os.unlink(temp_file_path)
+        except OSError:
+            pass
+
+
+def _worker_main(conn):
+    """Entry point of a warm render process: import manim once, then serve jobs."""
+    try:
+        import manim
+    except Exception as e:
+        conn.send({'ready': False, 'error': f"Could not import manim: {e}"})
+        conn.close()
+        return
+
+    conn.send({'ready': True, 'pid': os.getpid()})
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        # manim's console and progress bars write to sys.stdout/sys.stderr,
+        # so pointing those at the job's log file captures its output
+        with open(job['log_path'], 'a', encoding='utf-8', errors='replace', buffering=1) as log_file, \
+                contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+            result = _render_in_process(manim, job)
+        result['worker_memory_mb'] = _memory_usage_mb()
+        conn.send(result)
+
+    conn.close()
+
+
+class WorkerUnavailable(Exception):
+    """Raised when a warm worker can't be started or dies mid-job."""
+    pass
+
+
+class WarmWorker:
+    """Handle on one long-lived render process."""
+
+    def __init__(self, ctx, startup_timeout=120):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs_done = 0
+        self.memory_mb = None
+
+        # Waiting for the ready message is where the manim import cost is paid
+        if not self.conn.poll(startup_timeout):
+            self.stop()
+            raise WorkerUnavailable('Warm render worker did not start in time')
+        try:
+            hello = self.conn.recv()
+        except EOFError:
+            self.stop()
+            raise WorkerUnavailable('Warm render worker exited during startup')
+        if not hello.get('ready'):
+            self.stop()
+            raise WorkerUnavailable(hello.get('error', 'Warm render worker failed to start'))
+        self.pid = hello['pid']
+
+    def run(self, job, timeout):
+        """Send a job and wait for its result. Raises TimeoutError or WorkerUnavailable."""
+        try:
+            self.conn.send(job)
+            finished = self.conn.poll(timeout)
+            result = self.conn.recv() if finished else None
+        except (EOFError, OSError, BrokenPipeError) as e:
+            raise WorkerUnavailable(f"Warm render worker died: {e}")
+        # Raised outside the try: TimeoutError is an OSError and would be
+        # mistaken for a dead worker (and retried with a second full timeout)
+        if not finished:
+            raise TimeoutError
+        self.jobs_done += 1
+        self.memory_mb = result.pop('worker_memory_mb', None)
+        return result
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=2)
+        self.conn.close()
+
+
+class WarmRenderPool:
+    """
+    Pool of render processes that keep manim (numpy, cairo, pango, ...) imported
+    between jobs, so a render skips interpreter startup and `import manim`.
+
+    Workers are recycled after `max_jobs` renders or once their memory exceeds
+    `max_memory_mb`. If the pool can't be used (manim fails to import, a
+    worker crashes) the job falls back to the `python -m manim` subprocess path.
+    """
+
+    def __init__(self, size=2, max_jobs=50, max_memory_mb=1500, timeout=300):
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self.max_memory_mb = max_memory_mb
+        self.timeout = timeout
+        # spawn gives each worker a clean interpreter on every platform
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self.disabled_reason = None
+        self.stats = {'renders': 0, 'fallbacks': 0, 'recycled': 0, 'crashed': 0, 'timeouts': 0}
+
+    def _checkout(self, timeout=None):
+        """
+        Take an idle worker, starting a new one while under `size`. Returns
+        None if no worker becomes free within `timeout` seconds.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+                if worker is not None:
+                    return worker
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                can_start = self._started < self.size
+                if can_start:
+                    self._started += 1
+
+            if can_start:
+                try:
+                    worker = WarmWorker(self._ctx)
+                    print(f"🔥 Started warm render worker (pid {worker.pid})")
+                    return worker
+                except WorkerUnavailable:
+                    with self._lock:
+                        self._started -= 1
+                    raise
+
+            # Wait for a worker to be checked in, or for a discarded one's slot
+            # (signalled with None) so a replacement can be started
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return None
+            try:
+                worker = self._idle.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if worker is not None:
+                return worker
+
+    def _discard(self, worker):
+        worker.stop()
+        with self._lock:
+            self._started -= 1
+        self._idle.put(None)
+
+    def _checkin(self, worker):
+        too_old = worker.jobs_done >= self.max_jobs
+        too_big = worker.memory_mb is not None and worker.memory_mb > self.max_memory_mb
+        if too_old or too_big:
+            reason = f"{worker.jobs_done} jobs" if too_old else f"{worker.memory_mb:.0f} MB"
+            print(f"♻️ Recycling warm render worker (pid {worker.pid}, {reason})")
+            self.stats['recycled'] += 1
+            self._discard(worker)
+            return
+        self._idle.put(worker)
+
+    def warm_up(self):
+        """Start one worker ahead of the first render (call from a background thread)."""
+        try:
+            worker = self._checkout(timeout=self.timeout)
+            if worker is not None:
+                self._checkin(worker)
+        except WorkerUnavailable as e:
+            self.disabled_reason = str(e)
+            print(f"⚠️ Warm render pool disabled: {e}")
+
+    def render(self, code, output_dir="renders", quality="l", preview=False, output_name=None,
+               cache_partials=False, scene_name=None, log=None, module_name='scene'):
+        """
+        Same contract as render_manim_scene, but rendered by a warm worker.
+        The worker appends manim's output to the log file itself; the log
+        picks it up with sync() when progress is read.
+        """
+        if preview or self.disabled_reason:
+            return render_manim_scene(code, output_dir=output_dir, quality=quality,
+                                      preview=preview, output_name=output_name,
+                                      cache_partials=cache_partials, scene_name=scene_name,
+                                      log=log, module_name=module_name)
+
+        scene_name = scene_name or extract_scene_class_name(code)
+        if not scene_name:
+            return {
+                'success': False,
+                'error': 'No Scene class found in the code',
+                'video_path': None
+            }
+        os.makedirs(output_dir, exist_ok=True)
+        unique_id = f"{scene_name}_{output_name or int(time.time())}"
+
+        try:
+            worker = self._checkout(timeout=self.timeout)
+        except WorkerUnavailable as e:
+            self.disabled_reason = str(e)
+            print(f"⚠️ Warm render pool disabled, falling back to subprocess: {e}")
+            worker = None
+        if worker is None:
+            if not self.disabled_reason:
+                print(f"⚠️ No warm render worker free after {self.timeout}s, falling back to subprocess")
+            self.stats['fallbacks'] += 1
+            return render_manim_scene(code, output_dir=output_dir, quality=quality,
+                                      preview=preview, output_name=output_name,
+                                      cache_partials=cache_partials, scene_name=scene_name,
+                                      log=log, module_name=module_name)
+
+        if log is None:
+            log = render_logs.create(unique_id)
+        log.expect(count_animations(code, scene_name))
+        print(f"\n🎬 Rendering {scene_name} on warm worker (pid {worker.pid}, quality: {quality})")
+        job = {
+            'code': code,
+            'scene_name': scene_name,
+            'unique_id': unique_id,
+            'quality': quality,
+            'output_dir': output_dir,
+            'cache_partials': cache_partials,
+            'module_name': module_name,
+            'log_path': log.path,
+        }
+        try:
+            result = worker.run(job, self.timeout)
+        except TimeoutError:
+            self.stats['timeouts'] += 1
+            self._discard(worker)
+            return {
+                'success': False,
+                'error': f'Rendering timeout (exceeded {self.timeout} seconds)',
+                'video_path': None
+            }
+        except WorkerUnavailable as e:
+            # The scene may have crashed the interpreter; retry in isolation
+            print(f"⚠️ {e}, retrying with subprocess render")
+            self.stats['crashed'] += 1
+            self.stats['fallbacks'] += 1
+            self._discard(worker)
+            return render_manim_scene(code, output_dir=output_dir, quality=quality,
+                                      preview=preview, output_name=output_name,
+                                      cache_partials=cache_partials, scene_name=scene_name,
+                                      log=log, module_name=module_name)
+
+        log.sync()
+        self.stats['renders'] += 1
+        self._checkin(worker)
+        if result.get('success'):
+            record_render(result['video_path'], scene_name, quality, keep_partials=cache_partials)
+        return result
+
+    def describe(self):
+        with self._lock:
+            started = self._started
+        return {
+            'size': self.size,
+            'workers': started,
+            'idle': sum(1 for worker in list(self._idle.queue) if worker is not None),
+            'disabled_reason': self.disabled_reason,
+            **self.stats,
+        }
+
+
+warm_pool = WarmRenderPool(
+    size=config.WARM_RENDER_WORKERS,
+    max_jobs=config.WARM_RENDER_MAX_JOBS,
+    max_memory_mb=config.WARM_RENDER_MAX_MEMORY_MB,
+    timeout=config.RENDER_TIMEOUT,
+)
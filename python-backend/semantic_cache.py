@@ -0,0 +1,258 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_prompt(prompt):
+    """Lowercase and collapse whitespace/trailing punctuation for exact-match lookups."""
+    prompt = re.sub(r'\s+', ' ', prompt.strip().lower())
+    return prompt.rstrip(' .!?')
+
+
+class SemanticCache:
+    """
+    Cache of generated Manim code keyed by prompt embedding.
+
+    A prompt is a hit when its normalized text matches a cached prompt exactly
+    (no embedding call needed) or when the cosine similarity of its embedding
+    to a cached prompt's is at least `threshold`. Entries expire after `ttl`
+    seconds and the least recently used are evicted beyond `max_entries`.
+
+    Embeddings live in one unit-normalized matrix that rows are appended to and
+    swapped out of in place. The cache is persisted off the request path by a
+    background thread, at most every `save_delay` seconds: entries to the JSON
+    file at `path`, embeddings next to it as .npy.
+    """
+
+    def __init__(self, path, embed_fn, threshold=0.95, ttl=86400, max_entries=500, save_delay=2.0):
+        self.path = path
+        self.matrix_path = f"{os.path.splitext(path)[0]}.npy"
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.save_delay = save_delay
+        self._entries = OrderedDict()  # normalized prompt -> entry, least recently used first
+        self._matrix = None            # unit-normalized embeddings; only the first len(_matrix_keys) rows are used
+        self._matrix_keys = []         # row -> key
+        self._rows = {}                # key -> row
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._saver = None
+        self._save_lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._load()
+        atexit.register(self.flush)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not load semantic cache from {self.path}: {e}")
+            return
+        # Older cache files are a plain list with each embedding inline
+        entries = saved if isinstance(saved, list) else saved['entries']
+        for entry in sorted(entries, key=lambda e: e['last_access']):
+            self._entries[entry['key']] = entry
+        if isinstance(saved, list):
+            embeddings = {entry['key']: entry.pop('embedding', None) for entry in entries}
+        else:
+            embeddings = self._load_matrix(saved.get('matrix_keys', []))
+        for key, embedding in embeddings.items():
+            if embedding is not None and key in self._entries:
+                self._set_row(key, embedding)
+        self._expire()
+        print(f"📦 Loaded {len(self._entries)} cached responses from {self.path}")
+
+    def _load_matrix(self, keys):
+        """Embeddings saved by _save, as key -> row. Empty if the .npy is missing or out of step."""
+        try:
+            matrix = np.load(self.matrix_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not load semantic cache embeddings from {self.matrix_path}: {e}")
+            return {}
+        if len(matrix) != len(keys):
+            print(f"⚠️ {self.matrix_path} doesn't match {self.path}; only exact matches will hit")
+            return {}
+        return dict(zip(keys, matrix))
+
+    def _set_row(self, key, embedding):
+        """Add or replace `key`'s embedding row. Caller holds the lock."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        if self._matrix is not None and self._matrix.shape[1] != vector.shape[0]:
+            # The embedding model changed; old vectors can't be compared with new ones
+            print(f"⚠️ Embedding size changed ({self._matrix.shape[1]} -> {vector.shape[0]}), dropping cached embeddings")
+            self._matrix, self._matrix_keys, self._rows = None, [], {}
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._matrix_keys)
+            if self._matrix is None or row == len(self._matrix):
+                # Grow geometrically so appends stay cheap
+                grown = np.zeros((max(16, row * 2), vector.shape[0]), dtype=np.float32)
+                if self._matrix is not None:
+                    grown[:row] = self._matrix[:row]
+                self._matrix = grown
+            self._matrix_keys.append(key)
+            self._rows[key] = row
+        self._matrix[row] = vector
+
+    def _drop_row(self, key):
+        """Remove `key`'s embedding by moving the last row into its place. Caller holds the lock."""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last_key = self._matrix_keys.pop()
+        if last_key != key:
+            self._matrix[row] = self._matrix[len(self._matrix_keys)]
+            self._matrix_keys[row] = last_key
+            self._rows[last_key] = row
+
+    def _remove(self, key):
+        """Drop an entry and its embedding. Caller holds the lock."""
+        del self._entries[key]
+        self._drop_row(key)
+
+    def _save_soon(self):
+        """Have the saver thread write the cache shortly (many stores share one write)."""
+        with self._save_lock:
+            if self._saver is None:
+                self._saver = threading.Thread(target=self._run_saver, name='semantic-cache-save', daemon=True)
+                self._saver.start()
+        self._dirty.set()
+
+    def _run_saver(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.save_delay)
+            self._dirty.clear()
+            try:
+                self._save()
+            except OSError as e:
+                print(f"⚠️ Could not persist semantic cache: {e}")
+
+    def flush(self):
+        """Write pending changes now (runs at exit so the last stores aren't lost)."""
+        if self._dirty.is_set():
+            self._dirty.clear()
+            try:
+                self._save()
+            except OSError as e:
+                print(f"⚠️ Could not persist semantic cache: {e}")
+
+    def _save(self):
+        """Write the cache atomically: the embeddings first, then the entries that index them."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+            keys = list(self._matrix_keys)
+            matrix = self._matrix[:len(keys)].copy() if self._matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_matrix_path = f"{self.matrix_path}.tmp"
+        with open(tmp_matrix_path, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_matrix_path, self.matrix_path)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': entries, 'matrix_keys': keys}, f)
+        os.replace(tmp_path, self.path)
+
+    def _expire(self):
+        """Drop expired entries. Caller holds the lock (or is still constructing)."""
+        cutoff = time.time() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry['created_at'] < cutoff]
+        for key in expired:
+            self._remove(key)
+
+    def _touch(self, key):
+        entry = self._entries[key]
+        entry['last_access'] = time.time()
+        entry['hits'] = entry.get('hits', 0) + 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def lookup(self, prompt):
+        """
+        Find cached code for `prompt`.
+
+        Returns (hit, embedding): `hit` is a dict with code, matched prompt and
+        similarity, or None on a miss; `embedding` is the prompt's embedding
+        (None if it wasn't needed or couldn't be computed) so callers can reuse it.
+        """
+        key = normalize_prompt(prompt)
+        with self._lock:
+            self._expire()
+            if key in self._entries:
+                entry = self._touch(key)
+                self.hits += 1
+                return {'code': entry['code'], 'prompt': entry['prompt'], 'similarity': 1.0}, None
+
+        embedding = self.embed_fn(prompt)
+        if embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        with self._lock:
+            if self._matrix_keys and norm and self._matrix.shape[1] == query.shape[0]:
+                scores = self._matrix[:len(self._matrix_keys)] @ (query / norm)
+                best = int(np.argmax(scores))
+                similarity = float(scores[best])
+                if similarity >= self.threshold:
+                    best_key = self._matrix_keys[best]
+                    entry = self._touch(best_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return {'code': entry['code'], 'prompt': entry['prompt'], 'similarity': similarity}, embedding
+            self.misses += 1
+        return None, embedding
+
+    def store(self, prompt, code, embedding=None):
+        """Cache `code` as the answer to `prompt`."""
+        if embedding is None:
+            embedding = self.embed_fn(prompt)
+        key = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                'key': key,
+                'prompt': prompt,
+                'code': code,
+                'created_at': now,
+                'last_access': now,
+                'hits': 0,
+            }
+            self._entries.move_to_end(key)
+            if embedding is not None:
+                self._set_row(key, embedding)
+            else:
+                self._drop_row(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        self._save_soon()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'threshold': self.threshold,
+            }
@@ -0,0 +1,142 @@
+import os
+import shutil
+import struct
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+
+import config
+
+
+HLS_PLAYLIST = 'index.m3u8'
+
+
+@lru_cache(maxsize=1)
+def get_ffmpeg():
+    """Path to an ffmpeg binary, or None if there isn't one."""
+    found = shutil.which(config.FFMPEG_BINARY)
+    if found:
+        return found
+    try:
+        # Bundled binary from the imageio-ffmpeg wheel, if installed
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+def top_level_boxes(video_path):
+    """Names of the top-level MP4 boxes in file order (e.g. ['ftyp', 'moov', 'mdat'])."""
+    names = []
+    with open(video_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            size, name = struct.unpack('>I4s', f.read(8))
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+            elif size == 0:
+                size = file_size - offset
+            if size < 8:
+                break
+            names.append(name.decode('latin-1'))
+            offset += size
+    return names
+
+
+def is_faststart(video_path):
+    """True if the moov atom comes before the media data."""
+    boxes = top_level_boxes(video_path)
+    if 'moov' not in boxes or 'mdat' not in boxes:
+        return False
+    return boxes.index('moov') < boxes.index('mdat')
+
+
+def _run_ffmpeg(args):
+    ffmpeg = get_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError('ffmpeg not found')
+    result = subprocess.run(
+        [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', *args],
+        capture_output=True,
+        text=True,
+        timeout=config.PACKAGING_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+
+
+def faststart(video_path):
+    """
+    Move the moov atom to the front (remux only, no re-encode) so playback
+    can start before the whole file has downloaded. Returns True if the file
+    was rewritten.
+    """
+    if is_faststart(video_path):
+        return False
+    tmp_path = f"{video_path}.faststart.mp4"
+    try:
+        _run_ffmpeg(['-i', video_path, '-c', 'copy', '-map', '0', '-movflags', '+faststart', tmp_path])
+        os.replace(tmp_path, video_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return True
+
+
+def hls_dir(video_path):
+    """Folder holding the HLS playlist and segments for a video."""
+    path = Path(video_path)
+    return path.parent / f"{path.stem}_hls"
+
+
+def package_hls(video_path):
+    """Segment a video into HLS (copying the streams) and return the playlist path."""
+    out_dir = hls_dir(video_path)
+    playlist = out_dir / HLS_PLAYLIST
+    if playlist.exists():
+        return str(playlist)
+
+    # Build next to the final folder so a half-written playlist is never served
+    tmp_dir = out_dir.parent / f"{out_dir.name}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    try:
+        _run_ffmpeg([
+            '-i', str(video_path),
+            '-c', 'copy',
+            '-f', 'hls',
+            '-hls_time', str(config.HLS_SEGMENT_SECONDS),
+            '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', str(tmp_dir / 'segment_%03d.ts'),
+            str(tmp_dir / HLS_PLAYLIST),
+        ])
+        try:
+            tmp_dir.rename(out_dir)
+        except OSError:
+            # Another request packaged it first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return str(playlist)
+
+
+def package_video(video_path):
+    """
+    Post-render packaging of a fresh MP4 (faststart remux when
+    VIDEO_FASTSTART). Failures are logged and leave the file as manim wrote it.
+    """
+    if not config.VIDEO_FASTSTART or not get_ffmpeg():
+        return
+    try:
+        if faststart(video_path):
+            print(f"📦 Remuxed for faststart: {video_path}")
+    except Exception as e:
+        print(f"⚠️ Faststart remux failed for {video_path}: {e}")
+
+
+def remove_packages(video_path):
+    """Delete everything packaged from a video (called when the video is deleted)."""
+    shutil.rmtree(hls_dir(video_path), ignore_errors=True)